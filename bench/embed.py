@@ -0,0 +1,82 @@
+'''
+Microbenchmark for embedding binary payloads into C sources, compares
+the previous per-byte formatting (metalcompiler.writeBinHeader) with the
+bulk conversion in util/embed.py for all embed modes:
+
+    python bench/embed.py [numMBytes] [numRepeats]
+'''
+import os, sys, time, tempfile, binascii, re
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'fips-generators'))
+from shd import standalone
+standalone.install()
+from util import embed
+
+#-------------------------------------------------------------------------------
+def legacyWriteBinHeader(in_bin, out_hdr, c_name) :
+    '''
+    The previous metallib embedding (with the Python 3 indexing
+    bug fixed, so that both produce the same bytes).
+    '''
+    with open(in_bin, 'rb') as in_file :
+        data = in_file.read()
+    hexdata = binascii.hexlify(data).decode('ascii')
+    with open(out_hdr, 'w') as out_file :
+        out_file.write('#pragma once\n')
+        out_file.write('static const unsigned char {}[] = {{\n'.format(c_name))
+        for i in range(0, len(data)) :
+            out_file.write('0x{}{},'.format(hexdata[i*2], hexdata[i*2+1]))
+            if (i % 16) == 15 :
+                out_file.write('\n')
+        out_file.write('\n};\n')
+
+#-------------------------------------------------------------------------------
+def writeEmbedded(in_bin, out_src, c_name, mode) :
+    with open(out_src, 'w') as f :
+        embed.writePreamble(f, mode)
+        embed.writeBinary(f, c_name, in_bin, mode)
+
+#-------------------------------------------------------------------------------
+def bench(func, numRepeats) :
+    best = None
+    for i in range(0, numRepeats) :
+        start = time.time()
+        func()
+        duration = time.time() - start
+        best = duration if best is None else min(best, duration)
+    return best
+
+#-------------------------------------------------------------------------------
+def readArrayBytes(path) :
+    with open(path, 'r') as f :
+        return bytearray(int(x, 16) for x in re.findall(r'0x([0-9a-f]{2})', f.read()))
+
+#-------------------------------------------------------------------------------
+def main() :
+    numMBytes = float(sys.argv[1]) if len(sys.argv) > 1 else 4.0
+    numRepeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    data = os.urandom(int(numMBytes * 1024 * 1024))
+    tmpDir = tempfile.mkdtemp()
+    binPath = os.path.join(tmpDir, 'payload.bin')
+    legacyPath = os.path.join(tmpDir, 'legacy.h')
+    with open(binPath, 'wb') as f :
+        f.write(data)
+    try :
+        legacyTime = bench(lambda: legacyWriteBinHeader(binPath, legacyPath, 'payload'), numRepeats)
+        print('{:.1f} MBytes'.format(len(data) / (1024.0 * 1024.0)))
+        print('per-byte     : {:8.2f} ms'.format(legacyTime * 1000.0))
+        for mode in embed.MODES :
+            path = os.path.join(tmpDir, '{}.c'.format(mode))
+            newTime = bench(lambda: writeEmbedded(binPath, path, 'payload', mode), numRepeats)
+            print('bulk {:8}: {:8.2f} ms ({:.1f}x), {} bytes'.format(
+                mode, newTime * 1000.0, legacyTime / newTime, os.path.getsize(path)))
+            if mode == 'array' :
+                # both must embed the same bytes
+                assert readArrayBytes(path) == readArrayBytes(legacyPath), 'array contents differ'
+    finally :
+        for name in os.listdir(tmpDir) :
+            os.remove(os.path.join(tmpDir, name))
+        os.rmdir(tmpDir)
+
+if __name__ == '__main__' :
+    main()
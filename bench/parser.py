@@ -0,0 +1,253 @@
+'''
+Microbenchmark for the shader file parser, compares the single-pass
+scanner in Shader.Parser with the previous line-by-line comment
+stripping and per-line objects on a large synthetic shader library,
+for scanning alone (comments and whitespace removed, empty lines
+skipped), for the complete parse, and for the memory held by the
+complete parse result and by the line storage alone:
+
+    python bench/parser.py [numShaders] [numRepeats]
+'''
+import os, sys, time, tempfile, gc, tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'fips-generators'))
+from shd import standalone
+standalone.install()
+import Shader
+
+#-------------------------------------------------------------------------------
+def generateSource(numShaders) :
+    lines = []
+    lines.append('/* synthetic shader library')
+    lines.append('   for parser benchmarks */')
+    lines.append('@block common')
+    for i in range(0, 200) :
+        lines.append('    float common_{}(float x) {{ return x * {}.0; }}'.format(i, i))
+    lines.append('@end')
+    for i in range(0, numShaders) :
+        lines.append('')
+        lines.append('// vertex shader {}'.format(i))
+        lines.append('@vs vs{}'.format(i))
+        lines.append('uniform vsParams { mat4 mvp; };')
+        lines.append('in vec4 position;   /* object space */')
+        lines.append('out vec4 color;')
+        lines.append('@include common')
+        for j in range(0, 20) :
+            if (j % 5) == 0 :
+                lines.append('    /* step {} */ vec4 v{} = position * {}.0; // scale'.format(j, j, j))
+            else :
+                lines.append('    vec4 v{} = position * {}.0;'.format(j, j))
+        lines.append('void main() {')
+        lines.append('    /*')
+        lines.append('     * multi-line comment')
+        lines.append('     */')
+        lines.append('    gl_Position = mvp * position;')
+        lines.append('    color = vec4(1.0);')
+        lines.append('}')
+        lines.append('@end')
+        lines.append('@fs fs{}'.format(i))
+        lines.append('in vec4 color;')
+        lines.append('out vec4 fragColor;')
+        lines.append('void main() { fragColor = color; } // done')
+        lines.append('@end')
+        lines.append('@program prog{} vs{} fs{}'.format(i, i, i))
+    return '\n'.join(lines) + '\n'
+
+#-------------------------------------------------------------------------------
+class LegacyLine :
+    '''
+    The previous Line class (with a per-instance __dict__).
+    '''
+    def __init__(self, content, path='', lineNumber=0) :
+        self.content = content
+        self.include = None
+        self.path = path
+        self.lineNumber = lineNumber
+
+#-------------------------------------------------------------------------------
+class LegacyParser(Shader.Parser) :
+    '''
+    The previous parser which strips comments line by line
+    and creates LegacyLine objects.
+    '''
+    def __init__(self, shaderLib) :
+        Shader.Parser.__init__(self, shaderLib)
+        self.inComment = False
+
+    def stripCommentsFromLine(self, line) :
+        done = False
+        while not done :
+            if self.inComment :
+                endIndex = line.find('*/')
+                if endIndex == -1 :
+                    if '/*' in line or '//' in line :
+                        Shader.util.fmtError('comment in comment!')
+                    else :
+                        return ''
+                else :
+                    comment = line[:endIndex+2]
+                    if '/*' in comment or '//' in comment :
+                        Shader.util.fmtError('comment in comment!')
+                    else :
+                        line = line[endIndex+2:]
+                        self.inComment = False
+            wingedIndex = line.find('//')
+            if wingedIndex != -1 :
+                line = line[:wingedIndex]
+            startIndex = line.find('/*')
+            if startIndex != -1 :
+                endIndex = line.find('*/', startIndex)
+                if endIndex != -1 :
+                    line = line[:startIndex] + line[endIndex+2:]
+                else :
+                    self.inComment = True
+                    line = line[:startIndex]
+                    done = True
+            else :
+                done = True
+        return line.strip(' \t\n\r')
+
+    def scan(self, source) :
+        result = []
+        lineNumber = 0
+        for line in source.splitlines() :
+            Shader.util.setErrorLocation(self.fileName, lineNumber)
+            line = self.stripCommentsFromLine(line)
+            if line != '' :
+                result.append((lineNumber, line))
+            lineNumber += 1
+        return result
+
+    def push(self, obj) :
+        # the previous snippets kept their lines in a plain list
+        obj.lines = []
+        self.stack.append(self.current)
+        self.current = obj
+
+    def closeRange(self) :
+        pass
+
+    def parseSource(self, fileName) :
+        with open(fileName, 'r') as f :
+            source = f.read()
+        self.fileName = fileName
+        for self.lineNumber, line in self.scan(source) :
+            if self.current is not None and '@' not in line :
+                self.current.lines.append(LegacyLine(line, fileName, self.lineNumber))
+            else :
+                self.parseLine(line)
+
+#-------------------------------------------------------------------------------
+def bench(func, numRepeats) :
+    best = None
+    for i in range(0, numRepeats) :
+        # like timeit, don't let the garbage collector skew the results
+        gc.collect()
+        gc.disable()
+        start = time.time()
+        result = func()
+        duration = time.time() - start
+        gc.enable()
+        best = duration if best is None else min(best, duration)
+    return best, result
+
+#-------------------------------------------------------------------------------
+def scan(parserClass, source) :
+    parser = parserClass(None)
+    parser.fileName = 'bench.glsl'
+    if parserClass is LegacyParser :
+        return parser.scan(source)
+    text = parser.stripComments(source)
+    return [(lineNumber, line) for lineNumber, start, line in parser.scan(text)]
+
+#-------------------------------------------------------------------------------
+def getLines(shaderLib) :
+    '''
+    Return (lineNumber, content, include) of all parsed lines.
+    '''
+    result = []
+    for snippet in list(shaderLib.blocks.values()) + shaderLib.shaders :
+        for line in snippet.lines :
+            # @include statements are single-line spans
+            if isinstance(line, list) :
+                line = line[0]
+            result.append((line.lineNumber, line.content, line.include))
+    return result
+
+#-------------------------------------------------------------------------------
+def parse(parserClass, path) :
+    shaderLib = Shader.ShaderLibrary([path])
+    parserClass(shaderLib).parseSource(path)
+    return shaderLib
+
+#-------------------------------------------------------------------------------
+def measureMemory(parserClass, path) :
+    '''
+    Return the memory allocated by parsing, and the number of parsed lines.
+    '''
+    tracemalloc.start()
+    shaderLib = parse(parserClass, path)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    numLines = sum(len(snippet.lines) for snippet in list(shaderLib.blocks.values()) + shaderLib.shaders)
+    return size, numLines
+
+#-------------------------------------------------------------------------------
+def measureLineStorage(shaderLib) :
+    '''
+    Return the size of the objects which only exist to store the
+    parsed source lines (without snippets, programs, etc).
+    '''
+    size = 0
+    tables = {}
+    for snippet in list(shaderLib.blocks.values()) + shaderLib.shaders :
+        if isinstance(snippet.lines, list) :
+            for line in snippet.lines :
+                if isinstance(line, LegacyLine) :
+                    size += sys.getsizeof(line) + sys.getsizeof(line.__dict__) + sys.getsizeof(line.content)
+        else :
+            for span in snippet.lines.spans :
+                if isinstance(span, Shader.LineRange) :
+                    size += sys.getsizeof(span)
+                    tables[id(span.table)] = span.table
+    for table in tables.values() :
+        size += sys.getsizeof(table.text) + sys.getsizeof(table.lineNumbers) + sys.getsizeof(table.starts)
+    return size
+
+#-------------------------------------------------------------------------------
+def report(what, legacyTime, newTime) :
+    print('{}: line-by-line {:8.2f} ms, single-pass {:8.2f} ms ({:.2f}x)'.format(
+        what, legacyTime * 1000.0, newTime * 1000.0, legacyTime / newTime))
+
+#-------------------------------------------------------------------------------
+def main() :
+    numShaders = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    numRepeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    source = generateSource(numShaders)
+    fd, path = tempfile.mkstemp(suffix='.glsl')
+    with os.fdopen(fd, 'w') as f :
+        f.write(source)
+    try :
+        legacyScanTime, legacyLines = bench(lambda: scan(LegacyParser, source), numRepeats)
+        newScanTime, newLines = bench(lambda: scan(Shader.Parser, source), numRepeats)
+        legacyParseTime, legacyLib = bench(lambda: parse(LegacyParser, path), numRepeats)
+        newParseTime, newLib = bench(lambda: parse(Shader.Parser, path), numRepeats)
+        legacyMemory, numLines = measureMemory(LegacyParser, path)
+        newMemory, _ = measureMemory(Shader.Parser, path)
+        legacyStorage = measureLineStorage(legacyLib)
+        newStorage = measureLineStorage(newLib)
+    finally :
+        os.remove(path)
+    # both parsers must produce the same lines
+    assert legacyLines == newLines, 'scan results differ'
+    assert getLines(legacyLib) == getLines(newLib), 'parse results differ'
+    print('{} lines, {} bytes'.format(source.count('\n'), len(source)))
+    report('scan ', legacyScanTime, newScanTime)
+    report('parse', legacyParseTime, newParseTime)
+    print('memory: line-by-line {:8.1f} bytes/line, single-pass {:8.1f} bytes/line ({:.2f}x)'.format(
+        float(legacyMemory) / numLines, float(newMemory) / numLines, float(legacyMemory) / newMemory))
+    print('lines : line-by-line {:8.1f} bytes/line, single-pass {:8.1f} bytes/line ({:.2f}x)'.format(
+        float(legacyStorage) / numLines, float(newStorage) / numLines, float(legacyStorage) / newStorage))
+
+if __name__ == '__main__' :
+    main()
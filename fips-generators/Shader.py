@@ -2,11 +2,12 @@
 Code generator for shader libraries.
 '''
 
-Version = 1
+Version = 11
 
-import os, platform, json
+import os, sys, platform, json, re, hashlib, io
 import genutil as util
-from util import glslcompiler, shdc
+from util import glslcompiler, shdc, jobs, cache, process, embed, bundle, perfecthash, pool, minify, lz4, std140, outfile, trace, sizereport, declarations, reflectiondb, options
+from util.lines import Line, LineTable, LineRange, SourceSpans
 from mod import log
 import zlib # only for crc32
 
@@ -152,6 +153,7 @@ typedef struct {
     int slot;
     int count;
     shd_uniform *uniforms;
+    unsigned int layoutHash;
 } shd_uniform_block;
 
 typedef struct {
@@ -193,9 +195,68 @@ typedef struct {
 } shd_program_collection;
 
 SHD_API const shd_program_collection shd_get_programs(enum SHD_SHADER_TARGET_TYPE);
+SHD_API const shd_program *shd_find_program(const char *name, enum SHD_SHADER_TARGET_TYPE);
+SHD_API const shd_program *shd_get_program_by_id(enum SHD_PROGRAMS id, enum SHD_SHADER_TARGET_TYPE);
 SHD_API const enum SHD_SHADER_TARGET_TYPE *shd_get_slangs(int *count);
 SHD_API enum SHD_SHADER_TARGET_TYPE shd_get_default_slang();
 '''
+# payload states for compressed payloads: 0 compressed, 1 being decompressed, 2 loaded,
+# the first thread which accesses a payload decompresses it, the others wait for it
+PAYLOAD_STATE_SOURCE = '''#if defined(_MSC_VER)
+#include <intrin.h>
+typedef volatile long shd__payload_state;
+static long shd__state_cas(shd__payload_state *state, long expected, long desired) {
+    return _InterlockedCompareExchange(state, desired, expected);
+}
+static long shd__state_load(shd__payload_state *state) {
+    return _InterlockedCompareExchange(state, 0, 0);
+}
+static void shd__state_store(shd__payload_state *state, long value) {
+    _InterlockedExchange(state, value);
+}
+#elif defined(__GNUC__) || defined(__clang__)
+typedef long shd__payload_state;
+static long shd__state_cas(shd__payload_state *state, long expected, long desired) {
+    __atomic_compare_exchange_n(state, &expected, desired, 0, __ATOMIC_ACQ_REL, __ATOMIC_ACQUIRE);
+    return expected;
+}
+static long shd__state_load(shd__payload_state *state) {
+    return __atomic_load_n(state, __ATOMIC_ACQUIRE);
+}
+static void shd__state_store(shd__payload_state *state, long value) {
+    __atomic_store_n(state, value, __ATOMIC_RELEASE);
+}
+#elif !defined(__cplusplus) && defined(__STDC_VERSION__) && (__STDC_VERSION__ >= 201112L) && !defined(__STDC_NO_ATOMICS__)
+#include <stdatomic.h>
+typedef _Atomic long shd__payload_state;
+static long shd__state_cas(shd__payload_state *state, long expected, long desired) {
+    atomic_compare_exchange_strong(state, &expected, desired);
+    return expected;
+}
+static long shd__state_load(shd__payload_state *state) {
+    return atomic_load(state);
+}
+static void shd__state_store(shd__payload_state *state, long value) {
+    atomic_store(state, value);
+}
+#else
+/* no atomics available: programs must be looked up from one thread */
+typedef long shd__payload_state;
+static long shd__state_cas(shd__payload_state *state, long expected, long desired) {
+    long value = *state;
+    if (value == expected) {
+        *state = desired;
+    }
+    return value;
+}
+static long shd__state_load(shd__payload_state *state) {
+    return *state;
+}
+static void shd__state_store(shd__payload_state *state, long value) {
+    *state = value;
+}
+#endif
+'''
 if platform.system() == 'Windows' :
     from util import hlslcompiler
 
@@ -292,19 +353,37 @@ texShdType = {
     'sampler3D':      'SHD_SAMPLER_TYPE_3D',
     'sampler2DArray': 'SHD_SAMPLER_TYPE_ARRAY',
 }
-#-------------------------------------------------------------------------------
-class Line :
-    def __init__(self, content, path='', lineNumber=0) :
-        self.content = content
-        self.include = None         # name of an included block
-        self.path = path
-        self.lineNumber = lineNumber
+def getEnumValues(header) :
+    '''
+    Return the numeric values of all enum items in a C header.
+    '''
+    values = {}
+    for body in re.findall(r'enum \w+ \{([^}]*)\}', header) :
+        value = 0
+        for item in body.split(',') :
+            item = item.strip()
+            if not item :
+                continue
+            if '=' in item :
+                item, value = [token.strip() for token in item.split('=')]
+                value = int(value)
+            values[item] = value
+            value += 1
+    return values
+
+# the binary bundle stores enums by value
+enumValues = getEnumValues(DEFAULT_HEADER)
+
+# comments are removed from the whole source buffer in one pass,
+# unterminated multi-line comments extend to the end of the file
+commentRegex = re.compile(r'(//[^\n]*|/\*.*?(?:\*/|\Z))', re.S)
+nestedCommentRegex = re.compile(r'/\*|//')
 
 #-------------------------------------------------------------------------------
 class Snippet :
     def __init__(self) :
         self.name = None
-        self.lines = []
+        self.lines = SourceSpans()
 
 #-------------------------------------------------------------------------------
 class Block(Snippet) :
@@ -359,58 +438,56 @@ class Parser :
         self.lineNumber = 0
         self.current = None
         self.stack = []
-        self.inComment = False
-
-    def stripComments(self, line) :
-        '''
-        Remove comments from a single line, can carry
-        over to next or from previous line.
-        '''
-        done = False
-        while not done :
-            # if currently in comment, look for end-of-comment
-            if self.inComment :
-                endIndex = line.find('*/')
-                if endIndex == -1 :
-                    # entire line is comment
-                    if '/*' in line or '//' in line :
-                        util.fmtError('comment in comment!')
-                    else :
-                        return ''
-                else :
-                    comment = line[:endIndex+2]
-                    if '/*' in comment or '//' in comment :
-                        util.fmtError('comment in comment!')
-                    else :
-                        line = line[endIndex+2:]
-                        self.inComment = False
-
-            # clip off winged comment (if exists)
-            wingedIndex = line.find('//')
-            if wingedIndex != -1 :
-                line = line[:wingedIndex]
-
-            # look for start of comment
-            startIndex = line.find('/*')
-            if startIndex != -1 :
-                # ...and for the matching end...
-                endIndex = line.find('*/', startIndex)
-                if endIndex != -1 :
-                    line = line[:startIndex] + line[endIndex+2:]
-                else :
-                    # comment carries over to next line
-                    self.inComment = True
-                    line = line[:startIndex]
-                    done = True
-            else :
-                # no comment until end of line, done
-                done = True;
-        line = line.strip(' \t\n\r')
-        return line
+        self.table = None
+        self.rangeStart = 0
+
+    def stripComments(self, source) :
+        '''
+        Remove all comments from the source buffer in a single pass,
+        line breaks inside multi-line comments are kept so that
+        line numbers don't change.
+        '''
+        # split into [code, comment, code, comment, ..., code]
+        parts = commentRegex.split(source)
+        comments = parts[1::2]
+        for i, comment in enumerate(comments) :
+            if comment[1] != '*' :
+                continue
+            end = len(comment) - 2 if comment.endswith('*/') else len(comment)
+            nested = nestedCommentRegex.search(comment, 2, end)
+            if nested :
+                pos = sum(len(part) for part in parts[:2*i+1]) + nested.start()
+                self.lineNumber = source.count('\n', 0, pos)
+                util.setErrorLocation(self.fileName, self.lineNumber)
+                util.fmtError('comment in comment!')
+        parts[1::2] = ['\n' * comment.count('\n') for comment in comments]
+        return ''.join(parts)
+
+    def scan(self, text) :
+        '''
+        Yield (lineNumber, start, line) for each non-empty line of the
+        comment-stripped text, start is the offset of the line in the
+        text, line has the whitespace removed.
+        '''
+        start = 0
+        for lineNumber, line in enumerate(text.split('\n')) :
+            stripped = line.strip(' \t\r')
+            if stripped :
+                yield lineNumber, start, stripped
+            start += len(line) + 1
 
     def push(self, obj) :
         self.stack.append(self.current)
         self.current = obj
+        self.rangeStart = len(self.table)
+
+    def closeRange(self) :
+        '''
+        Add the source lines since the last tag to the current snippet.
+        '''
+        if len(self.table) > self.rangeStart :
+            self.current.lines.append(LineRange(self.table, self.rangeStart, len(self.table)))
+            self.rangeStart = len(self.table)
 
     def pop(self) :
         self.current = self.stack.pop();
@@ -467,100 +544,253 @@ class Parser :
     def onInclude(self, args) :
         if len(args) != 1:
             util.fmtError("@include must have 1 arg (name of included block)")
-        if not self.current or not self.current.getTag() in ['vs', 'fs'] :
-            util.fmtError("@include must come after @vs or @fs!")
+        if not self.current or not self.current.getTag() in ['block', 'vs', 'fs'] :
+            util.fmtError("@include must come after @block, @vs or @fs!")
         if self.current:
+            self.closeRange()
             l = Line(None, self.fileName, self.lineNumber)
             l.include = args[0]
-            self.current.lines.append(l)
+            self.current.lines.append([l])
+
+    def onImport(self, args) :
+        if len(args) != 1:
+            util.fmtError("@import must have 1 arg (path of the imported block file)")
+        if self.current is not None :
+            util.fmtError("@import must be at top level (missing @end in '{}'?)".format(self.current.name))
+        path = os.path.join(os.path.dirname(self.fileName), args[0])
+        self.shaderLib.importBlocks(path, self.fileName, self.lineNumber)
 
     def onEnd(self, args) :
         if not self.current or not self.current.getTag() in ['block', 'vs', 'fs'] :
             util.fmtError("@end must come after @block, @vs or @fs!")
         if len(args) != 0:
             util.fmtError("@end must not have arguments")
+        self.closeRange()
         if self.current.getTag() in ['block', 'vs', 'fs'] and len(self.current.lines) == 0 :
             util.fmtError("no source code lines in @block, @vs or @fs section")
         self.pop()
 
     def parseLine(self, line) :
-        line = self.stripComments(line)
-        if line != '':
-            tagStartIndex = line.find('@')
-            if tagStartIndex != -1 :
-                if tagStartIndex > 0 :
-                    util.fmtError("only whitespace allowed in front of tag")
-                if line.find(';') != -1 :
-                    util.fmtError("no semicolons allowed in tag lines")
-                tagAndArgs = line[tagStartIndex+1 :].split()
-                tag = tagAndArgs[0]
-                args = tagAndArgs[1:]
-                if tag == 'block':
-                    self.onBlock(args)
-                elif tag == 'vs':
-                    self.onVertexShader(args)
-                elif tag == 'fs':
-                    self.onFragmentShader(args)
-                elif tag == 'include':
-                    self.onInclude(args)
-                elif tag == 'program':
-                    self.onProgram(args)
-                elif tag == 'end':
-                    self.onEnd(args)
-                else :
-                    util.fmtError("unrecognized @ tag '{}'".format(tag))
-            elif self.current is not None:
-                self.current.lines.append(Line(line, self.fileName, self.lineNumber))
+        tagStartIndex = line.find('@')
+        if tagStartIndex != -1 :
+            util.setErrorLocation(self.fileName, self.lineNumber)
+            if tagStartIndex > 0 :
+                util.fmtError("only whitespace allowed in front of tag")
+            if line.find(';') != -1 :
+                util.fmtError("no semicolons allowed in tag lines")
+            tagAndArgs = line[tagStartIndex+1 :].split()
+            tag = tagAndArgs[0]
+            args = tagAndArgs[1:]
+            if tag == 'block':
+                self.onBlock(args)
+            elif tag == 'vs':
+                self.onVertexShader(args)
+            elif tag == 'fs':
+                self.onFragmentShader(args)
+            elif tag == 'include':
+                self.onInclude(args)
+            elif tag == 'program':
+                self.onProgram(args)
+            elif tag == 'import':
+                self.onImport(args)
+            elif tag == 'end':
+                self.onEnd(args)
+            else :
+                util.fmtError("unrecognized @ tag '{}'".format(tag))
 
-    def parseSource(self, fileName) :
-        f = open(fileName, 'r')
+    def parseSource(self, fileName, source=None) :
+        if source is None :
+            with open(fileName, 'r') as f :
+                source = f.read()
         self.fileName = fileName
         self.lineNumber = 0
-        for line in f :
-            util.setErrorLocation(self.fileName, self.lineNumber)
-            self.parseLine(line)
-            self.lineNumber += 1
-        f.close()
+        text = self.stripComments(source)
+        self.table = LineTable(fileName, text)
+        addLineNumber = self.table.lineNumbers.append
+        addStart = self.table.starts.append
+        for lineNumber, start, line in self.scan(text) :
+            if self.current is not None and '@' not in line :
+                # fast path for source code lines
+                addLineNumber(lineNumber)
+                addStart(start)
+            else :
+                self.lineNumber = lineNumber
+                self.parseLine(line)
         if self.current is not None :
+            util.setErrorLocation(self.fileName, source.count('\n'))
             util.fmtError('missing @end at end of file')
 
+#-------------------------------------------------------------------------------
+class BlockFile :
+    '''
+    The @blocks of an imported file, including the blocks
+    of files it imports itself.
+    '''
+    def __init__(self, path, hash, blocks, imports) :
+        self.path = path
+        self.hash = hash
+        self.blocks = blocks
+        self.imports = imports
+
+#-------------------------------------------------------------------------------
+class BlockIndex :
+    '''
+    Index of all imported block files, shared by all shader files
+    of a build so that each block file is only parsed once.
+    '''
+    def __init__(self) :
+        self.files = {}     # by hash of the file content
+        self.paths = {}     # file content hash by path
+        self.loading = []
+
+    def load(self, path) :
+        if path in self.paths :
+            return self.files[self.paths[path]]
+        if path in self.loading :
+            util.fmtError("cyclic @import of '{}'".format(path))
+        with open(path, 'r') as f :
+            source = f.read()
+        hash = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        if hash not in self.files :
+            self.loading.append(path)
+            lib = ShaderLibrary([path], self)
+            Parser(lib).parseSource(path, source)
+            self.loading.pop()
+            if lib.shaders or lib.programs :
+                util.setErrorLocation(path, 0)
+                util.fmtError("imported file '{}' must only contain @block sections".format(path))
+            self.files[hash] = BlockFile(path, hash, lib.blocks, lib.imports)
+        self.paths[path] = hash
+        return self.files[hash]
+
+    def invalidate(self, paths) :
+        '''
+        Forget the content of changed files, they are parsed
+        again (if their content changed) when imported next time.
+        '''
+        changed = set(os.path.normpath(os.path.abspath(path)) for path in paths)
+        for path, hash in list(self.paths.items()) :
+            blockFile = self.files.get(hash)
+            if path in changed or blockFile is None :
+                del self.paths[path]
+            elif changed.intersection(blockFile.imports) :
+                # the blocks of the imported files are part of the parsed file
+                del self.paths[path]
+                self.files.pop(hash, None)
+        self.loading = []
+
 #-------------------------------------------------------------------------------
 class ShaderLibrary :
     '''
     This represents the entire shader lib.
     '''
-    def __init__(self, inputs) :
+    def __init__(self, inputs, blockIndex=None) :
         self.sources = inputs
+        self.blockIndex = blockIndex or BlockIndex()
         self.blocks = {}
+        self.imports = []   # paths of all imported block files
         self.shaders = []
         self.vertexShaders = {}
         self.fragmentShaders = {}
         self.programs = {}
         self.current = None
 
+    def importBlocks(self, path, fileName, lineNumber) :
+        '''
+        Make the blocks of an imported file (and the files it
+        imports) visible in this library.
+        '''
+        path = os.path.normpath(os.path.abspath(path))
+        if path in self.imports :
+            return
+        if not os.path.isfile(path) :
+            util.fmtError("imported file '{}' not found".format(path))
+        blockFile = self.blockIndex.load(path)
+        util.setErrorLocation(fileName, lineNumber)
+        for importPath in [path] + blockFile.imports :
+            if importPath not in self.imports :
+                self.imports.append(importPath)
+        for name, block in blockFile.blocks.items() :
+            if name in self.blocks and self.blocks[name] is not block :
+                util.fmtError("@block '{}' already defined (imported from '{}')".format(name, path))
+            self.blocks[name] = block
+
     def parseSources(self) :
         parser = Parser(self)
         for source in self.sources :            
             parser.parseSource(source)
 
-    def validate(self, slangs) :
+    def checkDeclarations(self) :
         '''
-        Runs additional validation check after programs are resolved and before
-        shader code is generated:
+        Validation of the programs and of the declarations in the shader
+        sources, before any compiler runs (must be called after
+        generateShaderSources()):
 
+        - check whether the shaders of each program exist
         - check whether each vs and fs is part of a program
-        - check vertex shader inputs for valid types and names
-        - check whether vertex shader output matches fragment shader input
+        - check vertex shader inputs and uniform block members for valid types
+        - check whether each fragment shader input is a vertex shader output
+          of the same type
         '''
+        hasError = False
         for shd in self.shaders:
-            for prog in self.programs.values():
-                prog_shd = prog.vs if shd.getTag()=='vs' else prog.fs
-                if shd.name == prog_shd:
-                    break
-            else:
+            shd.declarations = declarations.scan(shd.generatedSource)
+        usedShaders = set()
+        for prog in self.programs.values():
+            for tag, name, shaders in [('vs', prog.vs, self.vertexShaders), ('fs', prog.fs, self.fragmentShaders)]:
+                if name not in shaders:
+                    util.setErrorLocation(prog.filePath, prog.lineNumber)
+                    util.fmtError("{} '{}' of program '{}' doesn't exist".format(tag, name, prog.name), False)
+                    hasError = True
+                usedShaders.add((tag, name))
+        for shd in self.shaders:
+            if (shd.getTag(), shd.name) not in usedShaders:
                 util.setErrorLocation(shd.lines[0].path, shd.lines[0].lineNumber)
-                util.fmtError("vertex shader '{}' is not part of a program".format(shd.name), False)
-                fatalError = True
+                util.fmtError("{} '{}' is not part of a program".format(shd.getTag(), shd.name), False)
+                hasError = True
+            errors = []
+            if shd.getTag() == 'vs':
+                for var in shd.declarations.inputs.values():
+                    if var.type not in validInOutTypes:
+                        errors.append((var.line, "invalid vertex shader input type '{}', must be ({})".format(var.type, ','.join(validInOutTypes))))
+            for blockName, blockLine, members in shd.declarations.blocks:
+                for var in members:
+                    validTypes = validUniformTypes if var.num == 1 else validUniformArrayTypes
+                    if var.type not in validTypes:
+                        errors.append((var.line, "invalid uniform block member type '{}', must be ({})".format(var.type, ','.join(validTypes))))
+            for line, msg in errors:
+                util.setErrorLocation(line.path, line.lineNumber)
+                util.fmtError(msg, False)
+                hasError = True
+        for prog in self.programs.values():
+            vs = self.vertexShaders.get(prog.vs)
+            fs = self.fragmentShaders.get(prog.fs)
+            if vs is None or fs is None:
+                continue
+            vs_outputs = vs.declarations.outputs
+            for fs_in in fs.declarations.inputs.values():
+                vs_out = vs_outputs.get(fs_in.name)
+                if vs_out is None or vs_out.type != fs_in.type:
+                    util.setErrorLocation(fs_in.line.path, fs_in.line.lineNumber)
+                    if vs_out is None:
+                        util.fmtError("input '{}' of fs '{}' isn't an output of vs '{}' (program '{}')".format(
+                            fs_in.name, fs.name, vs.name, prog.name), False)
+                    else:
+                        util.fmtError("input '{} {}' of fs '{}' doesn't match output '{} {}' of vs '{}' (program '{}')".format(
+                            fs_in.type, fs_in.name, fs.name, vs_out.type, vs_out.name, vs.name, prog.name), False)
+                    hasError = True
+        if hasError:
+            sys.exit(10)
+
+    def validate(self, slangs) :
+        '''
+        Runs additional validation checks on the reflection data of the
+        compiled shaders, before shader code is generated (the checks which
+        don't need the compiled shaders are done in checkDeclarations()):
+
+        - check vertex shader inputs for valid types and names
+        - check whether vertex shader output matches fragment shader input
+        '''
         for slang in slangs:
             for vs in self.vertexShaders.values():
                 refl = vs.slReflection[slang]
@@ -586,62 +816,189 @@ class ShaderLibrary :
                 vs = self.vertexShaders[prog.vs]
                 fs = self.fragmentShaders[prog.fs]
                 vs_outputs = vs.slReflection[slang]['outputs']
-                fs_inputs = fs.slReflection[slang]['inputs']
-                vs_fs_error = False
+                fs_inputs = dict((fs_in['name'], fs_in['type']) for fs_in in fs.slReflection[slang]['inputs'])
+                # unused items might have been removed by the compiler,
+                # only check when the number of inputs/outputs match
                 if len(vs_outputs) == len(fs_inputs):
                     for vs_out in vs_outputs:
-                        in_out_match = False
-                        for fs_in in fs_inputs:
-                            if (vs_out['name'] == fs_in['name']) and (vs_out['type'] == fs_in['type']):
-                                in_out_match = True
-                                break
-                        if not in_out_match:
-                            vs_fs_error = True
-                if vs_fs_error:
-                    # number of inputs/outputs don't match
-                    vs_fs_error = True
-                    util.setErrorLocation(vs.lines[0].path, vs.lines[0].lineNumber)
-                    util.fmtError("outputs of vs '{}' don't match inputs of fs '{}' (unused items might have been removed)".format(vs.name, fs.name))
+                        if fs_inputs.get(vs_out['name']) != vs_out['type']:
+                            util.setErrorLocation(vs.lines[0].path, vs.lines[0].lineNumber)
+                            util.fmtError("outputs of vs '{}' don't match inputs of fs '{}' (unused items might have been removed)".format(vs.name, fs.name))
+
+    def expandLines(self, lines, stack):
+        '''
+        Expand the @include statements in the lines of a snippet, returns
+        a list of spans which share the lines of included blocks.
+        '''
+        spans = []
+        for span in lines.spans:
+            l = span[0]
+            # @include statement?
+            if l.include:
+                if l.include not in self.blocks:
+                    util.setErrorLocation(l.path, l.lineNumber)
+                    util.fmtError("included block '{}' doesn't exist".format(l.include))
+                if l.include in stack:
+                    util.setErrorLocation(l.path, l.lineNumber)
+                    util.fmtError("cyclic @include of block '{}'".format(l.include))
+                spans.extend(self.expandBlock(l.include, stack))
+            else:
+                spans.append(span)
+        return spans
+
+    def expandBlock(self, name, stack):
+        '''
+        Return the expanded spans of a block, each block is only expanded once.
+        '''
+        if name not in self.expandedBlocks:
+            self.expandedBlocks[name] = self.expandLines(self.blocks[name].lines, stack + [name])
+        return self.expandedBlocks[name]
 
     def generateShaderSources(self):
+        self.expandedBlocks = {}
         for shd in self.shaders:
-            lines = []
-            for l in shd.lines:
-                # @include statement?
-                if l.include:
-                    if l.include not in self.blocks:
-                        util.setErrorLocation(incl.path, incl.lineNumber)
-                        util.fmtError("included block '{}' doesn't exist".format(incl.name))
-                    for lb in self.blocks[l.include].lines:
-                        lines.append(lb)
-                else:
-                    lines.append(l)
-            shd.generatedSource = lines
-
-    def loadReflection(self, shd, base_path, slangs):
+            shd.generatedSource = SourceSpans(self.expandLines(shd.lines, []))
+
+    def loadReflection(self, shd, base_path, slangs, key):
+        '''
+        Load the reflection files written by the compiler, and put them
+        into the reflection store.
+        '''
         for sl in slangs:
             refl_path = '{}.{}.json'.format(base_path, sl)
             with open(refl_path, 'r') as f:
                 shd.slReflection[sl] = json.load(f)
+        self.reflectionDB.put(key, shd, dict(shd.slReflection))
+
+    def getFingerprint(self, shd, compiler):
+        '''
+        Hash over everything which affects the compiled shader, this is
+        both the compile cache key, and the key in the reflection store
+        which is used to detect whether a shader needs to be recompiled.
+        '''
+        items = [str(Version), shd.name, shd.getTag(), ','.join(compiler.slangs),
+                 str(compiler.args.get('debug')), str(util.getEnv('target_platform'))]
+        items.extend(compiler.toolHashes)
+        items.extend(line.content for line in shd.generatedSource)
+        return cache.hashItems(items)
 
-    def compileShader(self, input, shd, base_path, slangs, args):
+    def getCompileOutputs(self, shd_base_path, slangs):
+        '''
+        Return a dictionary of cache entry file names to the
+        files produced by compiling a shader.
+        '''
+        spv_slang = 'glsl' if 'glsl' in slangs[0] else slangs[0]
+        files = {
+            'spv': '{}.{}.spv'.format(shd_base_path, spv_slang)
+        }
+        for slang in slangs:
+            files[slang] = '{}.{}'.format(shd_base_path, slang)
+            files[slang + '.json'] = '{}.{}.json'.format(shd_base_path, slang)
+        if 'metal' in slangs and util.getEnv('target_platform') in ['osx', 'ios']:
+            files['metallib'] = shd_base_path + '.metallib'
+        if 'hlsl' in slangs:
+            files['dxbc'] = shd_base_path + '.dxbc'
+        return files
+
+    def isUpToDate(self, key, files, slangs):
+        '''
+        Check whether the compiled outputs of a shader exist and its
+        fingerprint is in the reflection store, returns the stored
+        reflection data by slang, or None.
+        '''
+        for path in files.values():
+            if not os.path.isfile(path):
+                return None
+        return self.reflectionDB.get(key, slangs)
+
+    def addShaderJobs(self, compiler, input, shd, base_path):
+        '''
+        Add the job graph which compiles a single shader:
+        GLSL => SPIR-V => per-slang sources => metal/hlsl backends,
+        and loading the reflection data once all slangs are done.
+        If the shader hasn't changed since it was last compiled, or is
+        in the compile cache, only the reflection data is loaded.
+        '''
+        scheduler = compiler.scheduler
+        slangs = compiler.slangs
+        args = compiler.args
         shd_type = shd.getTag()
         shd_base_path = base_path + '_' + shd.name
-        glslcompiler.compile(shd.generatedSource, shd_type, shd_base_path, slangs[0], args)
-        shdc.compile(input, shd_base_path, slangs)
-        self.loadReflection(shd, shd_base_path, slangs)
+        key = self.getFingerprint(shd, compiler)
+        files = self.getCompileOutputs(shd_base_path, slangs)
+        reflection = self.isUpToDate(key, files, slangs)
+        if reflection is not None:
+            shd.slReflection.update(reflection)
+            return
+        if compiler.cache and compiler.cache.fetch(key, files):
+            scheduler.add('{}: load reflection'.format(shd.name), [],
+                self.loadReflection, shd, shd_base_path, slangs, key)
+            return
+        spirv_job = scheduler.add('{}: glsl to spirv'.format(shd.name), [],
+            glslcompiler.compile, shd.generatedSource, shd_type, shd_base_path, slangs[0], args)
+        slang_jobs = {}
+        for slang in slangs:
+            slang_jobs[slang] = scheduler.add('{}: spirv to {}'.format(shd.name, slang), [spirv_job],
+                shdc.compileSlang, input, shd_base_path, slang)
+        final_jobs = [scheduler.add('{}: load reflection'.format(shd.name), list(slang_jobs.values()),
+            self.loadReflection, shd, shd_base_path, slangs, key)]
         if 'metal' in slangs:
-            c_name = '{}_{}_metallib'.format(shd.name, shd_type)
-            metalcompiler.compile(shd.generatedSource, shd_base_path, c_name, args)
+            final_jobs.append(scheduler.add('{}: metal backend'.format(shd.name), [slang_jobs['metal']],
+                metalcompiler.compile, shd.generatedSource, shd_base_path, args))
         if 'hlsl' in slangs:
-            c_name = '{}_{}_hlsl5'.format(shd.name, shd_type)
-            hlslcompiler.compile(shd.generatedSource, shd_base_path, shd_type, c_name, args)
+            final_jobs.append(scheduler.add('{}: hlsl backend'.format(shd.name), [slang_jobs['hlsl']],
+                hlslcompiler.compile, shd.generatedSource, shd_base_path, shd_type, args))
+        if compiler.cache:
+            scheduler.add('{}: store in cache'.format(shd.name), final_jobs,
+                compiler.cache.store, key, files)
 
-    def compile(self, input, out_hdr, slangs, args) :
+    def addCompileJobs(self, compiler, input, out_hdr, reflectionDB=None) :
         log.info('## shader code gen: {}'.format(input)) 
         base_path = os.path.splitext(out_hdr)[0]
+        self.reflectionDB = reflectionDB or reflectiondb.ReflectionDB(base_path + '.refl.json')
         for shd in self.shaders:
-            self.compileShader(input, shd, base_path, slangs, args)
+            self.addShaderJobs(compiler, input, shd, base_path)
+
+    def compile(self, input, out_hdr, slangs, args) :
+        compiler = Compiler(slangs, args)
+        self.addCompileJobs(compiler, input, out_hdr)
+        compiler.run()
+        self.reflectionDB.save()
+
+#-------------------------------------------------------------------------------
+class Compiler :
+    '''
+    Compiles the shaders of one or more shader libraries, sharing
+    the worker pool, compile cache and tool hashes between them.
+    '''
+    def __init__(self, slangs, args) :
+        self.slangs = slangs
+        self.args = args
+        self.scheduler = jobs.Scheduler(jobs.getNumWorkers(args))
+        self.cache = cache.fromArgs(args)
+        self.toolHashes = self.getToolHashes()
+
+    def getToolHashes(self) :
+        hashes = [cache.hashFile(glslcompiler.getToolPath()), cache.hashFile(shdc.getToolPath())]
+        if 'metal' in self.slangs:
+            hashes.append(cache.hashFile(metalcompiler.getToolPath(util.getEnv('target_platform'))))
+        if 'hlsl' in self.slangs:
+            hashes.append(cache.hashFile(hlslcompiler.findFxc() or ''))
+        return hashes
+
+    def run(self) :
+        '''
+        Run all compile jobs which have been added so far.
+        '''
+        num_invocations = len(process.getInvocations())
+        self.scheduler.run()
+        if self.cache:
+            self.cache.evict()
+        invocations = process.getInvocations()[num_invocations:]
+        if invocations:
+            cpu_time = sum(inv.cpuTime or 0.0 for inv in invocations)
+            wall_time = sum(inv.wallTime for inv in invocations)
+            log.info('## {} tool runs, {:.2f}s wall, {:.2f}s cpu'.format(len(invocations), wall_time, cpu_time))
 
 #-------------------------------------------------------------------------------
 def writeHeaderTop(f, shdLib) :
@@ -672,10 +1029,13 @@ def writeHeaderBottom(f, shdLib) :
 
 #-------------------------------------------------------------------------------
 def getUniformBlockTypeHash(ub_refl):
+    '''
+    Hash over the memory layout of a uniform block (member names, types,
+    array sizes and offsets), blocks with the same hash share a C struct.
+    '''
     hashString = ''
     for member in ub_refl['members']:
-        hashString += member['type']
-        hashString += str(member['num'])
+        hashString += '{}:{}:{}:{};'.format(member['name'], member['type'], member['num'], member['offset'])
     return zlib.crc32(hashString.encode('ascii')) & 0xFFFFFFFF
 
 #-------------------------------------------------------------------------------
@@ -683,25 +1043,42 @@ def roundup(val, round_to):
     return (val + (round_to - 1)) & ~(round_to - 1)
 
 #-------------------------------------------------------------------------------
-def writeShaderUniformStructs(f, shd) :
+def writeShaderUniformStructs(f, shd, layouts) :
+    '''
+    Write the uniform block structs of a shader, each unique layout
+    (by getUniformBlockTypeHash) is only written once as
+    shd_uniform_layout_<hash>, the per shader and slang struct names
+    are aliases. layouts maps the hashes of the written structs to
+    their member lists.
+    '''
     for slangName in shd.slReflection :
         slang = shd.slReflection[slangName]
         for uniformBlock in slang['uniform_blocks'] :
-            cur_offset = 0
-            next_offset = 0
-            f.write('typedef struct {\n')
-            for member in uniformBlock['members'] : 
-                next_offset = member['offset']
-                numElements = member['num']
-                if next_offset > cur_offset:
-                    f.write('   uint8_t _pad_{}[{}];\n'.format(cur_offset, next_offset - cur_offset))
-                    cur_offset = next_offset
-                if numElements == 1:
-                    f.write('   {} {};\n'.format(uniformCType[member['type']], member['name']))
-                else:
-                    f.write('   {} {}[{}];\n'.format(uniformCType[member['type']], member['name'], numElements))
-                cur_offset += uniformCSize[member['type']] * member['num']
-            f.write('{} shd_{}_{}_params_{}_{};\n'.format('}', shd.getTag(), slangName, shd.name, uniformBlock['type']))
+            layoutHash = getUniformBlockTypeHash(uniformBlock)
+            layoutName = 'shd_uniform_layout_{:08x}'.format(layoutHash)
+            members = [(m['name'], m['type'], m['num'], m['offset']) for m in uniformBlock['members']]
+            if layoutHash in layouts:
+                if layouts[layoutHash] != members:
+                    util.setErrorLocation(shd.lines[0].path, shd.lines[0].lineNumber)
+                    util.fmtError("uniform block '{}' has the same layout hash as another block, please rename a member".format(uniformBlock['type']))
+            else:
+                layouts[layoutHash] = members
+                cur_offset = 0
+                next_offset = 0
+                f.write('typedef struct {\n')
+                for member in uniformBlock['members'] : 
+                    next_offset = member['offset']
+                    numElements = member['num']
+                    if next_offset > cur_offset:
+                        f.write('   uint8_t _pad_{}[{}];\n'.format(cur_offset, next_offset - cur_offset))
+                        cur_offset = next_offset
+                    if numElements == 1:
+                        f.write('   {} {};\n'.format(uniformCType[member['type']], member['name']))
+                    else:
+                        f.write('   {} {}[{}];\n'.format(uniformCType[member['type']], member['name'], numElements))
+                    cur_offset += uniformCSize[member['type']] * member['num']
+                f.write('{} {};\n'.format('}', layoutName))
+            f.write('typedef {} shd_{}_{}_params_{}_{};\n'.format(layoutName, shd.getTag(), slangName, shd.name, uniformBlock['type']))
 #-------------------------------------------------------------------------------
 def writeVertexShaderInputStructs(f, shd) :
     for slangName in shd.slReflection :
@@ -715,14 +1092,17 @@ def writeVertexShaderInputStructs(f, shd) :
             f.write('{} shd_inputs_{};\n'.format('}', shd.name))
         return # Note(pjako): shader inputs should look the same for all shading language, if not we need to generate it per api
 #-------------------------------------------------------------------------------
-def generateHeader(absHeaderPath, shdLib, slangs) :
-    f = open(absHeaderPath, 'w')
+def generateHeader(absHeaderPath, shdLib, slangs, hasBundle=False) :
+    f = outfile.OutputFile(absHeaderPath)
     writeHeaderTop(f, shdLib)
+    layouts = {}
     for shdName in shdLib.vertexShaders :
         writeVertexShaderInputStructs(f, shdLib.vertexShaders[shdName])
-        writeShaderUniformStructs(f, shdLib.vertexShaders[shdName])
+        writeShaderUniformStructs(f, shdLib.vertexShaders[shdName], layouts)
     for shdName in shdLib.fragmentShaders :
-        writeShaderUniformStructs(f, shdLib.fragmentShaders[shdName])
+        writeShaderUniformStructs(f, shdLib.fragmentShaders[shdName], layouts)
+    if hasBundle :
+        f.write(bundle.HEADER)
 
     writeHeaderBottom(f, shdLib)
     f.close()
@@ -735,6 +1115,7 @@ def writeSourceTop(f, absSourcePath, shdLib, slang) :
     f.write(' * #version:{}# machine generated, do not edit!\n'.format(Version))
     f.write(' * -----------------------------------------------------------------------------*/\n')
     f.write('#include "' + hdrFile + '.h"\n')
+    f.write('#include <string.h>\n')
     f.write('\n')
 
     f.write('#ifdef __cpp\n')
@@ -753,221 +1134,704 @@ def writeSourceBottom(f, shdLib) :
     f.write('\n')
 
 #-------------------------------------------------------------------------------
-def writeProgramDefinition(shd) :
-    f.write('typedef struct {')
-    refl = shd.slReflection[slang]
-    
-    for ub in refl['uniform_blocks']:
-        for m in ub['members']:
-            next_offset = m['offset']
-            numElements = m['num']
-            if next_offset > cur_offset:
-                f.write('   uint8_t _pad_{}[{}];\n'.format(cur_offset, next_offset - cur_offset))
-                cur_offset = next_offset
-            if numElements == 1:
-                f.write('   {} {};\n'.format(uniformCType[m['type']], m['name']))
-            else:
-                f.write('   {} {}[{}];\n'.format(uniformCType[m['type']], m['name'], numElements))
-            cur_offset += uniformCSize[m['type']] * m['num']
-    f.write('   ')
-    f.write('} shd_vs_params_{};\n'.format(shd.name))
-    f.write('shd_program shd_get_program_{}();\n'.format(shd.name))
+def getUniformBlockSize(ub) :
+    return sum(uniformCSize[m['type']] for m in ub['members'])
+
 #-------------------------------------------------------------------------------
+def isMetalLibPlatform():
+    # metal shaders can only be compiled to a .metallib on macOS
+    return util.getEnv('target_platform') in ['osx', 'ios']
 
-def writeShaderDetails(f, refl) :
-    blockIndex = 0
-    textures = refl['textures']
-    numTextures = len(textures)
-    if numTextures > 0:
-        f.write('           static shd_input textures[{}];\n'.format(numTextures))
-        idx = 0
-        for texture in textures:
-            slot = 0
-            if texture.get('slot'):
-                slot = texture['slot']
-            f.write('           textures[{}].name = (char *) "{}";\n'.format(idx, texture['name']))
-            f.write('           textures[{}].slot = {};\n'.format(idx, slot))
-            f.write('           textures[{}].type = {};\n'.format(idx, textureShdTypes[texture['type']]))
-            idx += 1
-        f.write('           shader.textures = &textures[0];\n')
+def getPayloadName(absPath, shd, slang) :
+    lib = re.sub(r'\W', '_', os.path.splitext(os.path.basename(absPath))[0])
+    return 'shd_{}_{}_{}_{}'.format(lib, shd.name, shd.getTag(), slang)
+
+def getShaderPayload(absPath, shd, slang) :
+    '''
+    Return the path of the compiled binary (or source) of a shader
+    for a slang, and whether it is a binary.
+    '''
+    base_path = os.path.splitext(absPath)[0] + '_' + shd.name
+    if isHLSL(slang):
+        return base_path + '.dxbc', True
+    elif isMetal(slang) and isMetalLibPlatform():
+        return base_path + '.metallib', True
     else:
-        f.write('           shader.textures = 0;\n')
-    f.write('           shader.textureCount = {};\n'.format(numTextures))
+        return '{}.{}'.format(base_path, slang), False
+
+def readShaderPayloads(absPath, shd, slangs, minifyGLSL) :
+    '''
+    Return (path, data, isBinary) of the compiled binary (or source) of
+    a shader for each slang. With minifyGLSL the GLSL sources are
+    minified, and written next to the original (for incbin).
+    '''
+    result = {}
+    numBytes = 0
+    numMinifiedBytes = 0
+    for slang in slangs:
+        path, isBinary = getShaderPayload(absPath, shd, slang)
+        with open(path, 'rb') as in_file:
+            data = in_file.read()
+        if minifyGLSL and isGLSL(slang) and not isBinary:
+            minified = minify.minify(data.decode('utf-8')).encode('utf-8')
+            numBytes += len(data)
+            numMinifiedBytes += len(minified)
+            data = minified
+            path += '.min'
+            outfile.writeIfChanged(path, data)
+        result[slang] = (path, data, isBinary)
+    if numBytes > 0:
+        log.info('## {}: minified {} to {} bytes ({} bytes saved)'.format(
+            shd.name, numBytes, numMinifiedBytes, numBytes - numMinifiedBytes))
+    return result
+
+def writeCompressedPayload(f, c_name, data, path, isBinary, embedMode) :
+    '''
+    Embed a payload LZ4 compressed as c_name_lz4, and a zero-initialized
+    buffer c_name which it is decompressed into on first use. Returns
+    the compressed size, or None (and writes nothing) if the payload
+    doesn't get smaller.
+    '''
+    packed = lz4.compress(data)
+    if len(packed) >= len(data):
+        return None
+    # for incbin
+    path += '.lz4'
+    outfile.writeIfChanged(path, packed)
+    f.write(embed.getDefinition(c_name + '_lz4', packed, embedMode or 'array', path, False))
+    # text payloads keep their zero terminator
+    c_type = 'unsigned char' if isBinary else 'char'
+    f.write('static {} {}[{}];\n'.format(c_type, c_name, len(data) + (0 if isBinary else 1)))
+    f.write('enum {{ {}_size = {} }};\n'.format(c_name, len(data)))
+    return len(packed)
+
+def writeShaderPayloads(f, absPath, shd, slangs, shaderPayloads, payloadSlangs, embedMode, payloads, compressed) :
+    '''
+    Embed the compiled binaries (or sources) of a shader, payloads which
+    are identical to an already embedded payload are not embedded again.
+    Each payload is guarded by the slangs which use it (payloadSlangs).
+    If compressed is a list, payloads are compressed, and (c_name, size,
+    compressed size, guard) of each compressed payload is added to it.
+    Returns a dict with the C name of the payload for each slang.
+    '''
+    names = {}
+    for slVersion in slangs:
+        c_name = getPayloadName(absPath, shd, slVersion)
+        path, data, isBinary = shaderPayloads[slVersion]
+        names[slVersion], isNew = payloads.add(c_name, data, isBinary)
+        if isNew:
+            guard = getSlangGuard(payloadSlangs[pool.getPayloadKey(data, isBinary)])
+            f.write('#if {}\n'.format(guard))
+            packedSize = None
+            if compressed is not None:
+                packedSize = writeCompressedPayload(f, c_name, data, path, isBinary, embedMode)
+            if packedSize is not None:
+                compressed.append((c_name, len(data), packedSize, guard))
+            else:
+                # default: C arrays for binaries, string literals for text
+                mode = embedMode or ('array' if isBinary else 'string')
+                f.write(embed.getDefinition(c_name, data, mode, path, not isBinary))
+            f.write('#endif\n')
+    return names
+
+def getSlangGuard(slangs) :
+    '''
+    Return the preprocessor condition which is true if any of
+    the slangs is enabled.
+    '''
+    return ' || '.join('defined(SHD_ENABLE_{})'.format(slang.upper()) for slang in slangs)
+
+def writeSlangDefaults(f, slangs) :
+    '''
+    Enable all slangs if none of them is enabled with a
+    SHD_ENABLE_<SLANG> define.
+    '''
+    f.write('/* without SHD_ENABLE_<SLANG> defines, all slangs are enabled */\n')
+    f.write('#if !({})\n'.format(getSlangGuard(slangs)))
+    for slang in slangs:
+        f.write('#define SHD_ENABLE_{}\n'.format(slang.upper()))
+    f.write('#endif\n')
+
+def getTableName(shd, slang, table) :
+    return 'shd__{}_{}_{}_{}'.format(shd.getTag(), shd.name, slang, table)
+
+def getShaderMacroName(shd, slang) :
+    return 'SHD__{}_{}_{}'.format(shd.getTag(), shd.name, slang)
+
+def writeTable(f, c_type, name, items) :
+    '''
+    Write a const array with one initializer per item, items are lists
+    of (field, value) in the declaration order of the struct fields.
+    Initializers are positional since designated initializers aren't
+    valid C++ before C++20 (the generated source is compiled as .cc).
+    '''
+    f.write('static const {} {}[{}] = {{\n'.format(c_type, name, len(items)))
+    for item in items:
+        f.write('    {{ {} }},\n'.format(', '.join(str(value) for key, value in item)))
+    f.write('};\n')
+
+def writeShaderTables(f, absPath, shd, slang, c_name, strings) :
+    '''
+    Write the const reflection tables of a shader for one slang, and a
+    macro with the shd_shader initializer (which is used in the program
+    tables, C doesn't allow to initialize a struct from another const).
+    c_name is the embedded payload, all names go into the string pool.
+    '''
+    refl = shd.slReflection[slang]
+    path, isBinary = getShaderPayload(absPath, shd, slang)
     inputs = refl['inputs']
-    inputsLeng = len(inputs)
-    if inputsLeng > 0:
-        f.write('           static shd_input inputs[{}];\n'.format(inputsLeng))
-        idx = 0
-        for input in inputs:
-            slot = 0
-            if input.get('slot'):
-                slot = input['slot']
-            f.write('           inputs[{}].name = (char *) "{}";\n'.format(idx, input['name']))
-            f.write('           inputs[{}].slot = {};\n'.format(idx, slot))
-            f.write('           inputs[{}].type = {};\n'.format(idx, inputShdTypes[input['type']]))
-            idx += 1
-        f.write('           shader.inputs = &inputs[0];\n')
-    else:
-        f.write('           shader.inputs = 0;\n')
-    f.write('           shader.inputCount = {};\n'.format(inputsLeng))
+    textures = refl['textures']
     blocks = refl['uniform_blocks']
-    f.write('           shader.uniformBlockCount = {};\n'.format(len(blocks)))
-    if len(blocks) == 0:
-        f.write('           shader.uniformBlocks = 0;\n')
+    if inputs:
+        writeTable(f, 'shd_input', getTableName(shd, slang, 'inputs'), [
+            [('type', inputShdTypes[input['type']]),
+             ('slot', input.get('slot') or 0),
+             ('name', strings.ref(input['name']))]
+            for input in inputs])
+    if textures:
+        writeTable(f, 'shd_texture', getTableName(shd, slang, 'textures'), [
+            [('type', texShdType[texture['type']]),
+             ('slot', texture.get('slot') or 0),
+             ('name', strings.ref(texture['name']))]
+            for texture in textures])
+    for blockIndex, ub in enumerate(blocks):
+        writeTable(f, 'shd_uniform', getTableName(shd, slang, 'ub{}_uniforms'.format(blockIndex)), [
+            [('name', strings.ref(m['name'])),
+             ('type', uniformEnumType[m['type']]),
+             ('offset', m['offset']),
+             ('size', uniformCSize[m['type']]),
+             ('count', m['num'])]
+            for m in ub['members']])
+    if blocks:
+        writeTable(f, 'shd_uniform_block', getTableName(shd, slang, 'blocks'), [
+            [('name', strings.ref(ub['type'])),
+             ('size', getUniformBlockSize(ub)),
+             ('slot', ub['slot']),
+             ('count', len(ub['members'])),
+             ('uniforms', '(shd_uniform *) {}'.format(getTableName(shd, slang, 'ub{}_uniforms'.format(blockIndex)))),
+             ('layoutHash', '0x{:08x}u'.format(getUniformBlockTypeHash(ub)))]
+            for blockIndex, ub in enumerate(blocks)])
+    fields = [
+        ('targetType', shdSlangTypes[slang]),
+        ('type', shdShaderTypes[shd.getTag()]),
+        ('name', strings.ref(shd.name)),
+        # this is the default entry created by cross SPIRV
+        ('entry', strings.ref('main0') if isMetal(slang) else '0'),
+        ('size', '{}_size'.format(c_name)),
+        ('binary', '(unsigned char *) {}'.format(c_name) if isBinary else '0'),
+        ('source', '0' if isBinary else '(char *) {}'.format(c_name)),
+        ('inputCount', len(inputs)),
+        ('inputs', '(shd_input *) {}'.format(getTableName(shd, slang, 'inputs')) if inputs else '0'),
+        ('uniformBlockCount', len(blocks)),
+        ('uniformBlocks', '(shd_uniform_block *) {}'.format(getTableName(shd, slang, 'blocks')) if blocks else '0'),
+        ('textureCount', len(textures)),
+        ('textures', '(shd_texture *) {}'.format(getTableName(shd, slang, 'textures')) if textures else '0'),
+    ]
+    f.write('#define {} {{ \\\n'.format(getShaderMacroName(shd, slang)))
+    for key, value in fields:
+        f.write('    {}, /* {} */ \\\n'.format(value, key))
+    f.write('}\n')
+
+def writeShaderSource(f, tables, absPath, shd, slangs, shaderPayloads, payloadSlangs, embedMode, payloads, compressed, strings) :
+    '''
+    Write the payloads of a shader to f, and its reflection tables
+    to tables (which must be written after the string pool). Returns
+    the C names of the payloads by slang.
+    '''
+    names = writeShaderPayloads(f, absPath, shd, slangs, shaderPayloads, payloadSlangs, embedMode, payloads, compressed)
+    for slang in slangs:
+        tables.write('#if {}\n'.format(getSlangGuard([slang])))
+        writeShaderTables(tables, absPath, shd, slang, names[slang], strings)
+        tables.write('#endif\n')
+    return names
+
+#-------------------------------------------------------------------------------
+def writeProgramTables(f, shdLib, slangs, strings) :
+    '''
+    Write one const table with all programs per slang.
+    '''
+    if not shdLib.programs:
         return
-    f.write('           static shd_uniform_block blocks[{}];\n'.format(len(blocks)))
-    for ub in blocks:
-        members = ub['members']
-        f.write('           blocks[{}].name = (char *) "{}";\n'.format(blockIndex, ub['type']))
-        f.write('           blocks[{}].slot = {};\n'.format(blockIndex, ub['slot']))
-        f.write('           blocks[{}].count = {};\n'.format(blockIndex, len(members)))
-        blockSize = 0
-        f.write('           {\n')
-        f.write('               static shd_uniform uniforms[{}];\n'.format(len(members)))
-        f.write('               blocks[{}].uniforms = &uniforms[0];\n'.format(blockIndex))
-        idx = 0
-        cur_offset = 0
-        for m in members:
-            next_offset = m['offset']
-            numElements = m['num']#uniformCSize
-            blockSize += uniformCSize[m['type']]
-            f.write('               uniforms[{}].name = (char *) "{}";\n'.format(idx, m['name']))
-            f.write('               uniforms[{}].type = {};\n'.format(idx, uniformEnumType[m['type']]))
-            f.write('               uniforms[{}].size = {};\n'.format(idx, uniformCSize[m['type']]))
-            f.write('               uniforms[{}].offset = {};\n'.format(idx, next_offset))
-            f.write('               uniforms[{}].count = {};\n'.format(idx, numElements))
-            cur_offset = next_offset
-            cur_offset += uniformCSize[m['type']] * m['num']
-            idx += 1
-        f.write('           }\n')
-        f.write('           blocks[{}].size = {};\n'.format(blockIndex, blockSize))
-        blockIndex += 1
-    f.write('           shader.uniformBlocks = &blocks[0];\n')
-#-------------------------------------------------------------------------------
-
-
-def writeShaderSource(f, absPath, shd, slangs) :
-    base_path = os.path.splitext(absPath)[0] + '_' + shd.name
-    metal_src_path = base_path + '.metal'
-    metal_bin_path = base_path + '.metallib.h'
-    for slVersion in shd.slReflection:
-        if isMetal(slVersion):
-            f.write('#include "{}"\n'.format(metal_bin_path))
-            metal_bin_path = base_path + '.metallib.h'
-        if isHLSL(slVersion):
-            hlsl_src_path = base_path + '.hlsl'
-            f.write('#include "{}"\n'.format(hlsl_bin_path))
-
-    #todo: put includes to the start!
-
-    f.write('const shd_shader shd_{}_{}(enum SHD_SHADER_TARGET_TYPE type) {}\n'.format(shd.getTag(), shd.name, '{'))
-    f.write('   shd_shader shader;\n')
-    f.write('   shader.type = {};\n'.format(shdShaderTypes[shd.getTag()]))
-    f.write('   shader.name = (char *) "{}";\n'.format(shd.name))
-    idx = 0
-    f.write('   switch(type) {\n')
-    f.write('       default:\n')
-    for slVersion in shd.slReflection:
-        slang = shd.slReflection[slVersion]
-        f.write('       case {}: {}\n'.format(shdSlangTypes[slVersion.lower()], '{'))
-        if isGLSL(slVersion):
-            f.write('       shader.binary = 0;\n')
-            # GLSL source code is directly inlined for runtime-compilation
-            f.write('       shader.source = \n'.format(idx))
-            glsl_src_path = '{}.{}'.format(base_path, slVersion)
-            with open(glsl_src_path, 'r') as rf:
-                lines = rf.read().splitlines()
-                for line in lines:
-                    f.write('               "{}\\n"\n'.format(line))
-            f.write('           ;\n')
-        elif isHLSL(slVersion):
-            # for HLSL, the actual shader code has been compiled into a header by FXC
-            # also write the generated shader source into a C comment as
-            # human-readable version
-            hlsl5CName = '{}_{}_hlsl5'.format(shd.name, shd.getTag())
-            f.write('           shader.binary = (unsigned char *) {};\n'.format(hlsl5CName))
-            f.write('           shader.source = 0;\n')
-            f.write('           shader.size =  sizeof({});\n'.format(hlsl5CName))
-        elif isMetal(slVersion):
-            # for Metal, the shader has been compiled into a binary shader
-            # library file, which needs to be embedded into the C header
-            mtlCName = '{}_{}_metallib'.format(shd.name, shd.getTag())
-            # this is the default entry created by cross SPIRV
-            f.write('           shader.entry = (char *) "main0";\n')
-            f.write('           shader.binary = (unsigned char *) {};\n'.format(mtlCName))
-            f.write('           shader.source = 0;\n')
-            f.write('           shader.size =  sizeof({});\n'.format(mtlCName))
-        writeShaderDetails(f, slang)
-        f.write('           break;\n')
-        f.write('       }\n')
-        idx += 1
-    f.write('   }\n')
-    # f.write('   shader.slangs = &slangs[0];\n')
-    f.write('   return shader;\n')
+    for slang in slangs:
+        items = []
+        for programName in shdLib.programs:
+            program = shdLib.programs[programName]
+            # vs and fs initialize the first struct of the anonymous union
+            items.append([
+                ('shaders', '{{ {{ {}, {} }} }}'.format(
+                    getShaderMacroName(shdLib.vertexShaders[program.vs], slang),
+                    getShaderMacroName(shdLib.fragmentShaders[program.fs], slang))),
+                ('id', 'SHD_PROGRAM_{}'.format(programName.upper())),
+                ('name', strings.ref(programName))])
+        f.write('#if {}\n'.format(getSlangGuard([slang])))
+        writeTable(f, 'shd_program', 'shd__programs_{}'.format(slang), items)
+        f.write('#endif\n')
+
+#-------------------------------------------------------------------------------
+def writeCompressedProgramSource(f, shdLib, slangs, compressed, payloadNames) :
+    '''
+    Write the decoder and tables for compressed payloads, and
+    shd__load_program() which decompresses the payloads of a
+    program (once, also if several threads access it at the
+    same time) when it is first accessed.
+    '''
+    indices = dict((c_name, index) for index, (c_name, size, packedSize, guard) in enumerate(compressed))
+    f.write(lz4.DECODE_SOURCE)
+    f.write(PAYLOAD_STATE_SOURCE)
+    f.write('typedef struct {\n')
+    f.write('    const unsigned char *src;\n')
+    f.write('    unsigned int srcSize;\n')
+    f.write('    unsigned char *dst;\n')
+    f.write('    shd__payload_state state;\n')
+    f.write('} shd__compressed_payload;\n')
+    # payloads of disabled slangs are kept as placeholders, so that the indices don't change
+    f.write('static shd__compressed_payload shd__compressed_payloads[{}] = {{\n'.format(len(compressed)))
+    for c_name, size, packedSize, guard in compressed:
+        f.write('#if {}\n'.format(guard))
+        f.write('    {{ (const unsigned char *) {0}_lz4, {0}_lz4_size, (unsigned char *) {0}, 0 }},\n'.format(c_name))
+        f.write('#else\n')
+        f.write('    { 0, 0, 0, 2 },\n')
+        f.write('#endif\n')
+    f.write('};\n')
+    # the compressed payload index of vs and fs for each slang and program, -1 if uncompressed
+    f.write('static const int shd__program_payloads[{}][{}][2] = {{\n'.format(len(slangs), len(shdLib.programs)))
+    for slang in slangs:
+        rows = []
+        for program in shdLib.programs.values():
+            vs = payloadNames[('vs', program.vs, slang)]
+            fs = payloadNames[('fs', program.fs, slang)]
+            rows.append('{{ {}, {} }}'.format(indices.get(vs, -1), indices.get(fs, -1)))
+        f.write('    {{ {} }},\n'.format(', '.join(rows)))
+    f.write('};\n')
+    f.write('static void shd__load_payload(shd__compressed_payload *p) {\n')
+    f.write('    if (shd__state_load(&p->state) == 2) {\n')
+    f.write('        return;\n')
+    f.write('    }\n')
+    f.write('    if (shd__state_cas(&p->state, 0, 1) == 0) {\n')
+    f.write('        shd__lz4_decode(p->src, p->srcSize, p->dst);\n')
+    f.write('        shd__state_store(&p->state, 2);\n')
+    f.write('    } else {\n')
+    f.write('        /* another thread is decompressing the payload */\n')
+    f.write('        while (shd__state_load(&p->state) != 2) {\n')
+    f.write('        }\n')
+    f.write('    }\n')
     f.write('}\n')
+    f.write('static void shd__load_program(int slang, int index) {\n')
+    f.write('    int i;\n')
+    f.write('    for (i = 0; i < 2; i++) {\n')
+    f.write('        int payload = shd__program_payloads[slang][index][i];\n')
+    f.write('        if (payload >= 0) {\n')
+    f.write('            shd__load_payload(&shd__compressed_payloads[payload]);\n')
+    f.write('        }\n')
+    f.write('    }\n')
+    f.write('}\n')
+
 #-------------------------------------------------------------------------------
-def writeProgramSource(f, program) :
-    f.write('const shd_program shd_get_program_{}(enum SHD_SHADER_TARGET_TYPE type) {}\n'.format(program.name, '{'))
-    f.write('   shd_program program;\n')
-    f.write('   program.name = (char *) "{}";\n'.format(program.name))
-    f.write('   program.id = SHD_PROGRAM_{},\n'.format(program.name.upper()))
-    f.write('   program.vs = (shd_shader) shd_vs_{}(type);\n'.format(program.vs))
-    f.write('   program.fs = (shd_shader) shd_fs_{}(type);\n'.format(program.fs))
-    f.write('   return program;\n')
+def writeProgramCollectionSource(f, shdLib, slangs, isCompressed) :
+    '''
+    Write shd__get_programs() which returns the programs of a slang
+    and the slang index, and shd_get_programs() on top of it (which
+    decompresses all programs of the slang if payloads are compressed).
+    '''
+    numPrograms = len(shdLib.programs)
+    f.write('static shd_program_collection shd__get_programs(enum SHD_SHADER_TARGET_TYPE type, int *slang) {\n')
+    f.write('    shd_program_collection collection = { 0, 0 };\n')
+    f.write('    *slang = -1;\n')
+    if numPrograms > 0:
+        f.write('    if (type == SHD_SHADER_TARGET_TYPE_DEFAULT) {\n')
+        f.write('        type = shd_get_default_slang();\n')
+        f.write('    }\n')
+        f.write('    switch (type) {\n')
+        for slangIndex, slang in enumerate(slangs):
+            f.write('#if {}\n'.format(getSlangGuard([slang])))
+            f.write('        case {}:\n'.format(shdSlangTypes[slang]))
+            f.write('            *slang = {};\n'.format(slangIndex))
+            f.write('            collection.count = {};\n'.format(numPrograms))
+            f.write('            collection.programs = (shd_program *) shd__programs_{};\n'.format(slang))
+            f.write('            break;\n')
+            f.write('#endif\n')
+        f.write('        default:\n')
+        f.write('            break;\n')
+        f.write('    }\n')
+    else:
+        f.write('    (void) type;\n')
+    f.write('    return collection;\n')
     f.write('}\n')
-def writeProgramCollectionSource(f, programs) :
     f.write('const shd_program_collection shd_get_programs(enum SHD_SHADER_TARGET_TYPE type) {\n')
-    numPrograms = len(programs)
-    f.write('   static shd_program programs[{}];\n'.format(numPrograms))
-    idx = 0
-    for programName in programs:
-        f.write('   programs[{}] = (shd_program) shd_get_program_{}(type);\n'.format(idx, programName))
-        idx += 1
-    f.write('   return (shd_program_collection) {\n')
-    f.write('       {}, &programs[0]\n'.format(numPrograms))
-    f.write('   };\n')
+    f.write('    int slang;\n')
+    f.write('    shd_program_collection collection = shd__get_programs(type, &slang);\n')
+    if isCompressed:
+        f.write('    int i;\n')
+        f.write('    for (i = 0; i < collection.count; i++) {\n')
+        f.write('        shd__load_program(slang, i);\n')
+        f.write('    }\n')
+    f.write('    return collection;\n')
     f.write('}\n')
+
 #-------------------------------------------------------------------------------
-def generateSource(absSourcePath, shdLib, slangs) :
-    f = open(absSourcePath, 'w') 
-    writeSourceTop(f, absSourcePath, shdLib, slangs[0])
+def writeProgramLookupSource(f, shdLib, isCompressed) :
+    '''
+    Write shd_find_program() which looks up programs by name with a
+    perfect hash built over the program names, and shd_get_program_by_id().
+    If payloads are compressed, only the returned program is decompressed.
+    '''
+    names = list(shdLib.programs)
+    numPrograms = len(names)
+    if numPrograms > 0:
+        f.write(perfecthash.HASH_SOURCE)
+    f.write('const shd_program *shd_get_program_by_id(enum SHD_PROGRAMS id, enum SHD_SHADER_TARGET_TYPE type) {\n')
+    f.write('    int slang;\n')
+    f.write('    shd_program_collection collection = shd__get_programs(type, &slang);\n')
+    f.write('    if (((int) id < 1) || ((int) id > collection.count)) {\n')
+    f.write('        return 0;\n')
+    f.write('    }\n')
+    if isCompressed:
+        f.write('    shd__load_program(slang, (int) id - 1);\n')
+    f.write('    return &collection.programs[id - 1];\n')
+    f.write('}\n')
+    f.write('const shd_program *shd_find_program(const char *name, enum SHD_SHADER_TARGET_TYPE type) {\n')
+    if numPrograms == 0:
+        f.write('    (void) name; (void) type;\n')
+        f.write('    return 0;\n')
+        f.write('}\n')
+        return
+    seeds, indices = perfecthash.build(names)
+    f.write('    static const unsigned int seeds[{}] = {{ {} }};\n'.format(numPrograms, ', '.join(str(seed) for seed in seeds)))
+    f.write('    static const unsigned int indices[{}] = {{ {} }};\n'.format(numPrograms, ', '.join(str(index) for index in indices)))
+    f.write('    int slang;\n')
+    f.write('    shd_program_collection collection = shd__get_programs(type, &slang);\n')
+    f.write('    unsigned int h, index;\n')
+    f.write('    if (!name || (collection.count == 0)) {\n')
+    f.write('        return 0;\n')
+    f.write('    }\n')
+    f.write('    h = shd__crc32(name);\n')
+    f.write('    index = indices[shd__mix(h ^ seeds[shd__mix(h) % {0}]) % {0}];\n'.format(numPrograms))
+    f.write('    if (strcmp(collection.programs[index].name, name) != 0) {\n')
+    f.write('        return 0;\n')
+    f.write('    }\n')
+    if isCompressed:
+        f.write('    shd__load_program(slang, (int) index);\n')
+    f.write('    return &collection.programs[index];\n')
+    f.write('}\n')
 
-    for shader in shdLib.shaders:
-        writeShaderSource(f, absSourcePath, shader, slangs)
+#-------------------------------------------------------------------------------
+def generateSource(absSourcePath, shdLib, slangs, embedMode=None, minifyGLSL=False, compress=False) :
+    '''
+    Write the C source with the embedded payloads and reflection tables,
+    returns the payloads of all shaders (see readShaderPayloads()).
+    '''
+    f = outfile.OutputFile(absSourcePath)
+    writeSourceTop(f, absSourcePath, shdLib, slangs[0])
+    embed.writePreamble(f, embedMode)
 
-    for programName in shdLib.programs:
-        writeProgramSource(f, shdLib.programs[programName])
+    writeSlangDefaults(f, slangs)
 
-    writeProgramCollectionSource(f, shdLib.programs)
+    # identical payloads and names are only emitted once, payloads
+    # are compiled in if any slang which uses them is enabled
+    shaderPayloads = [readShaderPayloads(absSourcePath, shader, slangs, minifyGLSL) for shader in shdLib.shaders]
+    payloadSlangs = {}
+    for slangPayloads in shaderPayloads:
+        for slang in slangs:
+            path, data, isBinary = slangPayloads[slang]
+            payloadSlangs.setdefault(pool.getPayloadKey(data, isBinary), []).append(slang)
+    payloads = pool.PayloadPool()
+    strings = pool.StringPool('shd__strings')
+    tables = io.StringIO()
+    compressed = [] if compress else None
+    payloadNames = {}
+    for shader, slangPayloads in zip(shdLib.shaders, shaderPayloads):
+        names = writeShaderSource(f, tables, absSourcePath, shader, slangs, slangPayloads, payloadSlangs,
+            embedMode, payloads, compressed, strings)
+        for slang in slangs:
+            payloadNames[(shader.getTag(), shader.name, slang)] = names[slang]
+    writeProgramTables(tables, shdLib, slangs, strings)
+    strings.write(f)
+    f.write(tables.getvalue())
+    if payloads.numBytes > payloads.numUniqueBytes:
+        log.info('## {} of {} payload bytes shared'.format(payloads.numBytes - payloads.numUniqueBytes, payloads.numBytes))
+
+    isCompressed = bool(compressed) and len(shdLib.programs) > 0
+    if isCompressed:
+        log.info('## compressed {} payloads from {} to {} bytes'.format(len(compressed),
+            sum(c[1] for c in compressed), sum(c[2] for c in compressed)))
+        writeCompressedProgramSource(f, shdLib, slangs, compressed, payloadNames)
+    writeProgramCollectionSource(f, shdLib, slangs, isCompressed)
+    writeProgramLookupSource(f, shdLib, isCompressed)
+    # the default slang is the first enabled slang
     f.write('enum SHD_SHADER_TARGET_TYPE shd_get_default_slang() {\n')
-    f.write('   return {};\n'.format(shdSlangTypes[slangs[0]]))
+    for slang in slangs:
+        f.write('#{} {}\n'.format('if' if slang == slangs[0] else 'elif', getSlangGuard([slang])))
+        f.write('    return {};\n'.format(shdSlangTypes[slang]))
+    f.write('#endif\n')
     f.write('}\n')
 
-    f.write('const enum SHD_SHADER_TARGET_TYPE *shd_get_slangs(int *count) {\n')
-    f.write('   static const enum SHD_SHADER_TARGET_TYPE slangs[{}] = {}\n'.format(len(slangs), '{'))
+    f.write('static const enum SHD_SHADER_TARGET_TYPE shd__slangs[] = {\n')
     for slang in slangs:
-        f.write('       {},\n'.format(shdSlangTypes[slangs[0]]))
-    f.write('   };\n')
-    f.write('   *count = {};\n'.format(len(slangs)))
-    f.write('   return &slangs[0];\n')
+        f.write('#if {}\n'.format(getSlangGuard([slang])))
+        f.write('    {},\n'.format(shdSlangTypes[slang]))
+        f.write('#endif\n')
+    f.write('};\n')
+    f.write('const enum SHD_SHADER_TARGET_TYPE *shd_get_slangs(int *count) {\n')
+    f.write('    *count = (int) (sizeof(shd__slangs) / sizeof(shd__slangs[0]));\n')
+    f.write('    return shd__slangs;\n')
     f.write('}\n')
-        
 
     writeSourceBottom(f, shdLib)
     f.close()
+    return shaderPayloads
 
 #-------------------------------------------------------------------------------
-def generate(input, out_src, out_hdr, args) :
-    f = open(out_src, 'w')
-    f.write('/* Hack to get around that fips forces .cc for the source file */')
+def generateBundle(absBundlePath, absSourcePath, shdLib, slangs, minifyGLSL=False) :
+    '''
+    Write all programs, shaders, payloads and reflection data
+    of a shader library into a binary bundle file, returns the
+    payloads of all shaders.
+    '''
+    writer = bundle.Writer([enumValues[shdSlangTypes[slang]] for slang in slangs])
+    shaderIndices = {}
+    allPayloads = []
+    for shd in shdLib.shaders:
+        variants = []
+        shaderPayloads = readShaderPayloads(absSourcePath, shd, slangs, minifyGLSL)
+        allPayloads.append(shaderPayloads)
+        for slang in slangs:
+            refl = shd.slReflection[slang]
+            path, payload, isBinary = shaderPayloads[slang]
+            # this is the default entry created by cross SPIRV
+            entry = 'main0' if isMetal(slang) else None
+            variant = bundle.Variant(entry, payload, isBinary)
+            for input in refl['inputs']:
+                variant.inputs.append((enumValues[inputShdTypes[input['type']]], input.get('slot') or 0, input['name']))
+            for texture in refl['textures']:
+                variant.textures.append((enumValues[texShdType[texture['type']]], texture.get('slot') or 0, texture['name']))
+            for ub in refl['uniform_blocks']:
+                members = [(m['name'], enumValues[uniformEnumType[m['type']]], m['offset'], uniformCSize[m['type']], m['num'])
+                    for m in ub['members']]
+                variant.blocks.append((ub['type'], getUniformBlockSize(ub), ub['slot'], members, getUniformBlockTypeHash(ub)))
+            variants.append(variant)
+        shaderIndices[(shd.getTag(), shd.name)] = writer.addShader(shd.name, enumValues[shdShaderTypes[shd.getTag()]], variants)
+    for id, programName in enumerate(shdLib.programs):
+        program = shdLib.programs[programName]
+        writer.addProgram(program.name, id + 1, shaderIndices[('vs', program.vs)], shaderIndices[('fs', program.fs)])
+    writer.write(absBundlePath)
+    return allPayloads
+
+#-------------------------------------------------------------------------------
+def generateBundleSource(absSourcePath, shdLib, slangs) :
+    '''
+    Write the C source for the bundle output mode, which only contains
+    the reader for the bundle file.
+    '''
+    f = outfile.OutputFile(absSourcePath)
+    writeSourceTop(f, absSourcePath, shdLib, slangs[0])
+    f.write(bundle.getReader())
+    writeSourceBottom(f, shdLib)
     f.close()
+
+#-------------------------------------------------------------------------------
+def getBundlePath(out_hdr) :
+    return os.path.splitext(out_hdr)[0] + '.shdb'
+
+#-------------------------------------------------------------------------------
+def getSizeReportPath(out_hdr) :
+    return os.path.splitext(out_hdr)[0] + '.size.json'
+
+#-------------------------------------------------------------------------------
+def getUniformStructSize(ub) :
+    # sizeof() of the generated struct, including the padding members
+    return max([m['offset'] + uniformCSize[m['type']] * m['num'] for m in ub['members']] + [0])
+
+#-------------------------------------------------------------------------------
+def getSizeReport(shdLib, slangs, shaderPayloads) :
+    '''
+    Build the size report of a shader library (see util/sizereport.py),
+    shaderPayloads are the payloads of all shaders as returned by
+    generateSource() or generateBundle().
+    '''
+    payloads = {}
+    for shd, slangPayloads in zip(shdLib.shaders, shaderPayloads):
+        payloads[(shd.getTag(), shd.name)] = slangPayloads
+    users = [(program.name, 'vs', program.vs) for program in shdLib.programs.values()]
+    users += [(program.name, 'fs', program.fs) for program in shdLib.programs.values()]
+    shaders = dict(((shd.getTag(), shd.name), shd) for shd in shdLib.shaders)
+    entries = []
+    for programName, stage, shaderName in users:
+        shd = shaders[(stage, shaderName)]
+        for slang in slangs:
+            path, data, isBinary = payloads[(stage, shaderName)][slang]
+            refl = shd.slReflection[slang]
+            entries.append({
+                'program': programName,
+                'stage': stage,
+                'shader': shaderName,
+                'slang': slang,
+                'source': 0 if isBinary else len(data) + 1,
+                'binary': len(data) if isBinary else 0,
+                'reflection': sizereport.getReflectionSize(refl, shaderName),
+                'uniformStructs': sum(getUniformStructSize(ub) for ub in refl['uniform_blocks']),
+            })
+    numBytes = 0
+    unique = {}
+    for slangPayloads in shaderPayloads:
+        for slang in slangs:
+            path, data, isBinary = slangPayloads[slang]
+            numBytes += len(data)
+            unique[pool.getPayloadKey(data, isBinary)] = len(data)
+    return sizereport.build(entries, numBytes, sum(unique.values()))
+
+#-------------------------------------------------------------------------------
+def getStampPath(out_hdr) :
+    return os.path.splitext(out_hdr)[0] + '.gen.stamp'
+
+#-------------------------------------------------------------------------------
+def getStampArgs(args) :
+    '''
+    The generator args which affect the outputs, as recorded in the
+    stamp file (changing one of them regenerates all shader files).
+    '''
+    return json.dumps({
+        'slang': args.get('slang'),
+        'embed': embed.getMode(args),
+        'output': args.get('output') or 'source',
+        'minify': options.isTrue(args, 'minify'),
+        'compress': options.isTrue(args, 'compress'),
+        'debug': str(args.get('debug')),
+    }, sort_keys=True)
+
+#-------------------------------------------------------------------------------
+def readStampArgs(stampPath) :
+    try :
+        with open(stampPath, 'r') as f :
+            f.readline()
+            return f.readline().rstrip('\n')
+    except (IOError, OSError) :
+        return None
+
+#-------------------------------------------------------------------------------
+def isLibraryDirty(inputs, outputs, stampPath, stampArgs) :
+    '''
+    Outputs are only rewritten when their content changes, so their
+    modification time can be older than the inputs after a regeneration,
+    the stamp file records when the outputs were last generated, and
+    with which generator args.
+    '''
+    for path in outputs :
+        if not os.path.exists(path) :
+            return True
+    if util.isDirty(Version, inputs, [stampPath]) :
+        return True
+    return readStampArgs(stampPath) != stampArgs
+
+#-------------------------------------------------------------------------------
+def writeLibraryStamp(stampPath, stampArgs) :
+    # always written (unlike the outputs) to update the modification time
+    with open(stampPath, 'w') as f :
+        f.write('#version:{}#\n{}\n'.format(Version, stampArgs))
+
+#-------------------------------------------------------------------------------
+class Generator :
+    '''
+    Generates the C sources and headers of shader files. The worker pool,
+    compile cache, parsed block files and reflection stores are kept
+    between calls to run(), so that a long-running process (see
+    'python -m shd watch') only recompiles the shaders which changed.
+    '''
+    def __init__(self, args) :
+        self.args = args
+        self.slangs = slVersions[args['slang']]
+        self.embedMode = embed.getMode(args)
+        self.minifyGLSL = options.isTrue(args, 'minify')
+        self.compress = options.isTrue(args, 'compress')
+        self.layoutMode = std140.getMode(args)
+        self.output = args.get('output') or 'source'
+        if self.output not in ['source', 'bundle'] :
+            util.fmtError("invalid output mode '{}' (must be source or bundle)".format(self.output))
+        if self.compress and self.output == 'bundle' :
+            log.warn('payload compression is only supported for the source output, bundles are not compressed')
+        self.stampArgs = getStampArgs(args)
+        self.compiler = Compiler(self.slangs, args)
+        self.blockIndex = BlockIndex()
+        self.reflectionDBs = {}     # by header path
+        self.libraries = {}         # last parsed ShaderLibrary by input path
+
+    def getReflectionDB(self, out_hdr) :
+        if out_hdr not in self.reflectionDBs :
+            path = os.path.splitext(out_hdr)[0] + '.refl.json'
+            self.reflectionDBs[out_hdr] = reflectiondb.ReflectionDB(path)
+        return self.reflectionDBs[out_hdr]
+
+    def invalidate(self, paths) :
+        '''
+        Forget the parsed versions of changed block files.
+        '''
+        self.blockIndex.invalidate(paths)
+
+    def run(self, files) :
+        '''
+        Generate the dirty files of a list of (input, out_src, out_hdr)
+        tuples, the shaders of all dirty files are compiled together on
+        one worker pool. Returns the number of generated files.
+        '''
+        slangs = self.slangs
+        output = self.output
+        libraries = []
+        for input, out_src, out_hdr in files :
+            name = os.path.basename(input)
+            shaderLibrary = ShaderLibrary([input], self.blockIndex)
+            with trace.span('parse ' + name, group='parse') :
+                shaderLibrary.parseSources()
+            self.libraries[input] = shaderLibrary
+            outputs = [out_src, out_hdr, getSizeReportPath(out_hdr)]
+            if output == 'bundle' :
+                outputs.append(getBundlePath(out_hdr))
+            # imported block files are dependencies too
+            if isLibraryDirty([input] + shaderLibrary.imports, outputs, getStampPath(out_hdr), self.stampArgs) :
+                with trace.span('prepare ' + name, group='prepare') :
+                    shaderLibrary.generateShaderSources()
+                    shaderLibrary.checkDeclarations()
+                    shaderLibrary.addCompileJobs(self.compiler, input, out_hdr, self.getReflectionDB(out_hdr))
+                libraries.append((shaderLibrary, out_src, out_hdr))
+        with trace.span('compile') :
+            self.compiler.run()
+        for shaderLibrary, out_src, out_hdr in libraries :
+            shaderLibrary.reflectionDB.save()
+        for shaderLibrary, out_src, out_hdr in libraries :
+            name = os.path.basename(shaderLibrary.sources[0])
+            with trace.span('validate ' + name, group='validate') :
+                shaderLibrary.validate(slangs)
+            if self.layoutMode :
+                std140.report([(shd.name, ub) for shd in shaderLibrary.shaders
+                    for ub in shd.slReflection[slangs[0]]['uniform_blocks']], self.layoutMode)
+            with trace.span('generate source ' + name, group='generate source') :
+                if output == 'bundle' :
+                    shaderPayloads = generateBundle(getBundlePath(out_hdr), out_src, shaderLibrary, slangs, self.minifyGLSL)
+                    generateBundleSource(out_src, shaderLibrary, slangs)
+                else :
+                    shaderPayloads = generateSource(out_src, shaderLibrary, slangs,
+                        self.embedMode, self.minifyGLSL, self.compress)
+            with trace.span('generate header ' + name, group='generate header') :
+                generateHeader(out_hdr, shaderLibrary, slangs, output == 'bundle')
+            sizereport.write(getSizeReportPath(out_hdr), getSizeReport(shaderLibrary, slangs, shaderPayloads))
+            writeLibraryStamp(getStampPath(out_hdr), self.stampArgs)
+        trace.write()
+        return len(libraries)
+
+#-------------------------------------------------------------------------------
+def generateMany(files, args) :
+    '''
+    Generate the C source and header for many shader files in one go,
+    files is a list of (input, out_src, out_hdr) tuples. The shaders of
+    all dirty files are compiled together on one worker pool.
+    '''
+    if files :
+        trace.configure(args, os.path.splitext(os.path.basename(files[0][0]))[0])
+    return Generator(args).run(files)
+
+#-------------------------------------------------------------------------------
+def generate(input, out_src, out_hdr, args) :
+    # only create the placeholder if it's missing, generateMany() overwrites
+    # it, and rewriting it each time would recompile it on every build
+    if not os.path.exists(out_src) :
+        outfile.writeIfChanged(out_src, '/* Hack to get around that fips forces .cc for the source file */')
     #out_src = out_src.replace('.cc', '.c')
-    if util.isDirty(Version, [input], [out_src, out_hdr]) :
-        slangs = slVersions[args['slang']]
-        shaderLibrary = ShaderLibrary([input])
-        shaderLibrary.parseSources()
-        shaderLibrary.generateShaderSources()
-        shaderLibrary.compile(input, out_hdr, slangs, args)
-        shaderLibrary.validate(slangs)
-        generateSource(out_src, shaderLibrary, slangs)
-        generateHeader(out_hdr, shaderLibrary, slangs)
\ No newline at end of file
+    generateMany([(input, out_src, out_hdr)], args)
@@ -0,0 +1,4 @@
+'''
+Standalone (fips-less) driver for the shader code generator,
+run with 'python -m shd'.
+'''
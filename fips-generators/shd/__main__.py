@@ -0,0 +1,184 @@
+'''
+Command line entry point, compiles many shader files in one process:
+
+    python -m shd build a.glsl b.glsl ... --out dir [--slang GLSL] [-j N]
+
+rebuilds them whenever they (or imported block files) are saved:
+
+    python -m shd watch a.glsl b.glsl ... --out dir [--slang GLSL] [-j N]
+
+and compares generated size reports with a budget:
+
+    python -m shd size-check dir/a.size.json budget.json [--tolerance 5]
+'''
+import os, sys, argparse, platform, json, time
+
+# make the code generator modules importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shd import standalone
+standalone.install()
+
+#-------------------------------------------------------------------------------
+def getDefaultPlatform() :
+    return {
+        'Darwin': 'osx',
+        'Windows': 'win64',
+    }.get(platform.system(), 'linux')
+
+#-------------------------------------------------------------------------------
+def getOutputs(input, out_dir, ext) :
+    base = os.path.splitext(os.path.basename(input))[0]
+    return (os.path.join(out_dir, base + ext), os.path.join(out_dir, base + '.h'))
+
+#-------------------------------------------------------------------------------
+def getArgs(opts) :
+    '''
+    Return the generator args for the command line options.
+    '''
+    import genutil as util
+    if util is standalone :
+        util.setEnv('target_platform', opts.platform)
+    return {
+        'type': 'glsl',
+        'slang': opts.slang,
+        'debug': 'true' if opts.debug else 'false',
+        'jobs': opts.jobs,
+        'cache': 'false' if opts.no_cache else 'true',
+        'embed': opts.embed,
+        'output': opts.output,
+        'minify': 'true' if opts.minify else 'false',
+        'compress': 'true' if opts.compress else 'false',
+        'uniform_layout': opts.uniform_layout,
+        'trace': opts.trace,
+    }
+
+#-------------------------------------------------------------------------------
+def getFiles(opts) :
+    '''
+    Return the (input, out_src, out_hdr) tuples for the inputs.
+    '''
+    import genutil as util
+    if not os.path.isdir(opts.out) :
+        os.makedirs(opts.out)
+    files = []
+    outputs = set()
+    for input in opts.inputs :
+        out_src, out_hdr = getOutputs(input, opts.out, opts.ext)
+        if out_hdr in outputs :
+            util.setErrorLocation(input, 0)
+            util.fmtError("output file name '{}' is used by more than one input".format(out_hdr))
+        outputs.add(out_hdr)
+        files.append((os.path.abspath(input), os.path.abspath(out_src), os.path.abspath(out_hdr)))
+    return files
+
+#-------------------------------------------------------------------------------
+def build(opts) :
+    import Shader
+    args = getArgs(opts)
+    files = getFiles(opts)
+    num = Shader.generateMany(files, args)
+    print('## {} of {} shader files generated'.format(num, len(files)))
+
+#-------------------------------------------------------------------------------
+def watch(opts) :
+    '''
+    Build the inputs, then rebuild each input when it or one of its
+    imported block files changes. Parsed block files, reflection data
+    and the worker pool are kept between builds, only shaders whose
+    source changed are compiled again.
+    '''
+    import Shader
+    from util import watcher, trace
+    args = getArgs(opts)
+    files = getFiles(opts)
+    trace.configure(args, os.path.splitext(os.path.basename(files[0][0]))[0])
+    generator = Shader.Generator(args)
+    fileWatcher = watcher.create(opts.poll)
+    print('## watching {} shader files ({})'.format(len(files), type(fileWatcher).__name__))
+    pending = files
+    try :
+        while True :
+            start = time.time()
+            try :
+                num = generator.run(pending)
+                print('## {} of {} shader files generated in {:.0f} ms'.format(num, len(pending), (time.time() - start) * 1000))
+            except SystemExit :
+                print('## build failed, waiting for changes')
+            # the imports of a shader file can change with each build
+            imports = {}
+            for input, out_src, out_hdr in files :
+                lib = generator.libraries.get(input)
+                imports[input] = set(lib.imports) if lib else set()
+            fileWatcher.setPaths(set(imports).union(*imports.values()))
+            changed = fileWatcher.wait()
+            generator.invalidate(changed)
+            pending = [file for file in files if file[0] in changed or imports[file[0]] & changed]
+    except KeyboardInterrupt :
+        pass
+
+#-------------------------------------------------------------------------------
+def sizeCheck(opts) :
+    from util import sizereport
+    with open(opts.report, 'r') as f :
+        report = json.load(f)
+    with open(opts.budget, 'r') as f :
+        budget = json.load(f)
+    failures = sizereport.check(report, budget, opts.tolerance)
+    for name, size, limit in failures :
+        print("{}: '{}' is {} bytes, budget is {} bytes (+{} bytes)".format(opts.report, name, size, limit, size - limit))
+    if failures :
+        return 1
+    print('## {}: {} bytes, within budget'.format(opts.report, report['total']))
+    return 0
+
+#-------------------------------------------------------------------------------
+def addBuildArguments(cmd) :
+    cmd.add_argument('inputs', nargs='+', help='.glsl shader files')
+    cmd.add_argument('--out', required=True, help='output directory')
+    cmd.add_argument('--slang', default='GLSL', choices=['GLSL', 'GLES', 'MSL', 'HLSL'],
+        help='target shader language group (default: GLSL)')
+    cmd.add_argument('--ext', default='.c', help='extension of generated sources (default: .c)')
+    cmd.add_argument('--platform', default=getDefaultPlatform(),
+        help='target platform, e.g. osx or ios for Metal (default: host)')
+    cmd.add_argument('-j', '--jobs', type=int, default=0,
+        help='number of parallel compile jobs (default: one per CPU core)')
+    cmd.add_argument('--debug', action='store_true', help='compile shaders with debug information')
+    cmd.add_argument('--no-cache', action='store_true', help="don't use the compile cache")
+    cmd.add_argument('--embed', choices=['array', 'string', 'incbin'],
+        help='how shader binaries and sources are embedded (default: arrays for binaries, strings for sources)')
+    cmd.add_argument('--output', default='source', choices=['source', 'bundle'],
+        help='embed shaders in the generated source, or write a .shdb bundle file per input (default: source)')
+    cmd.add_argument('--minify', action='store_true',
+        help='remove comments and redundant whitespace from embedded GLSL sources')
+    cmd.add_argument('--compress', action='store_true',
+        help='compress embedded payloads, they are decompressed when a program is first used')
+    cmd.add_argument('--uniform-layout', choices=['report', 'propose'],
+        help='report the std140 padding of uniform blocks, and propose member orders with less padding')
+    cmd.add_argument('--trace', metavar='FILE',
+        help='write a Chrome trace of all build phases and tool runs to FILE (or $SHD_TRACE)')
+
+#-------------------------------------------------------------------------------
+def main(argv) :
+    parser = argparse.ArgumentParser(prog='shd', description='shader code generator')
+    commands = parser.add_subparsers(dest='command')
+    cmd = commands.add_parser('build', help='compile shader files to C sources and headers')
+    addBuildArguments(cmd)
+    cmd.set_defaults(func=build)
+    cmd = commands.add_parser('watch', help='build shader files, and rebuild them when they change')
+    addBuildArguments(cmd)
+    cmd.add_argument('--poll', action='store_true', help='poll for changes instead of using inotify')
+    cmd.set_defaults(func=watch)
+    cmd = commands.add_parser('size-check', help='compare a generated .size.json report with a budget')
+    cmd.add_argument('report', help='.size.json report written next to the generated header')
+    cmd.add_argument('budget', help='budget file, e.g. a previous report')
+    cmd.add_argument('--tolerance', type=float, default=0.0,
+        help='allowed growth over the budget in percent (default: 0)')
+    cmd.set_defaults(func=sizeCheck)
+    opts = parser.parse_args(argv)
+    if not opts.command :
+        parser.print_help()
+        return 1
+    return opts.func(opts) or 0
+
+if __name__ == '__main__' :
+    sys.exit(main(sys.argv[1:]))
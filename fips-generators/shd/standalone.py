@@ -0,0 +1,96 @@
+'''
+Minimal stand-ins for the fips 'genutil' and 'mod.log' modules,
+used when the code generator runs outside of fips.
+'''
+import os, sys, platform, types
+
+Env = {}
+FilePath = ''
+LineNumber = 0
+
+#-------------------------------------------------------------------------------
+def setEnv(key, value) :
+    Env[key] = value
+
+#-------------------------------------------------------------------------------
+def getEnv(key) :
+    return Env.get(key)
+
+#-------------------------------------------------------------------------------
+def setErrorLocation(filePath, lineNumber) :
+    global FilePath, LineNumber
+    FilePath = filePath
+    LineNumber = lineNumber
+
+#-------------------------------------------------------------------------------
+def fmtError(msg, terminate=True) :
+    if platform.system() == 'Windows' :
+        print('{}({}): error: {}'.format(FilePath, LineNumber + 1, msg))
+    else :
+        print('{}:{}: error: {}\n'.format(FilePath, LineNumber + 1, msg))
+    if terminate :
+        sys.exit(10)
+
+#-------------------------------------------------------------------------------
+def fmtWarning(msg) :
+    if platform.system() == 'Windows' :
+        print('{}({}): warning: {}'.format(FilePath, LineNumber + 1, msg))
+    else :
+        print('{}:{}: warning: {}\n'.format(FilePath, LineNumber + 1, msg))
+
+#-------------------------------------------------------------------------------
+def fileVersionDirty(filePath, version) :
+    '''
+    Check the '#version:X#' tag in the first lines of a generated file.
+    '''
+    with open(filePath, 'r') as f :
+        for i in range(0, 4) :
+            line = f.readline()
+            if '#version:{}#'.format(version) in line :
+                return False
+    return True
+
+#-------------------------------------------------------------------------------
+def isDirty(version, inputs, outputs) :
+    '''
+    Outputs are dirty if one is missing, was created by another
+    generator version, or is older than any of the inputs.
+    '''
+    for output in outputs :
+        if not os.path.exists(output) or fileVersionDirty(output, version) :
+            return True
+    inputTime = max(os.path.getmtime(input) for input in inputs)
+    outputTime = min(os.path.getmtime(output) for output in outputs)
+    return inputTime > outputTime
+
+#-------------------------------------------------------------------------------
+def info(msg) :
+    print(msg)
+
+#-------------------------------------------------------------------------------
+def warn(msg) :
+    print('[warning] {}'.format(msg))
+
+#-------------------------------------------------------------------------------
+def error(msg, fatal=True) :
+    print('[error] {}'.format(msg))
+    if fatal :
+        sys.exit(10)
+
+#-------------------------------------------------------------------------------
+def install() :
+    '''
+    Register this module as 'genutil' and 'mod.log', unless the real
+    fips modules can be imported.
+    '''
+    try :
+        import genutil
+    except ImportError :
+        sys.modules['genutil'] = sys.modules[__name__]
+    try :
+        from mod import log
+    except ImportError :
+        mod = types.ModuleType('mod')
+        mod.log = sys.modules[__name__]
+        sys.modules['mod'] = mod
+        sys.modules['mod.log'] = mod.log
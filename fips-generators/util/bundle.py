@@ -0,0 +1,540 @@
+'''
+Binary shader bundle, holds all programs, shaders, slang payloads and
+reflection tables of a shader library in one file which is memory-mapped
+at runtime by a small generated reader.
+
+All values are little-endian 32-bit unsigned integers, offsets are
+relative to the start of the file, strings are zero-terminated and
+stored in a string table, text payloads are zero-terminated too (not
+included in the payload size), and payloads are 16-byte aligned. Strings
+and payloads are only stored once, and may be shared by several records:
+
+    header:     'SHDB', version, fileSize, numSlangs, numPrograms,
+                numShaders, numInputs, numTextures, numBlocks,
+                numUniforms, slangsOffset, programsOffset, shadersOffset,
+                stringsOffset, stringsSize, hashOffset
+    slang:      targetType (the first slang is the default slang)
+    program:    name, id, vsIndex, fsIndex
+    hash:       numPrograms seeds, then numPrograms program indices (the
+                perfect hash over the program names, see perfecthash.py)
+    shader:     name, type, then per slang: entry (NO_STRING if none),
+                payloadOffset, payloadSize, isBinary, numInputs,
+                inputsOffset, numTextures, texturesOffset, numBlocks,
+                blocksOffset
+    input:      type, slot, name
+    texture:    type, slot, name
+    block:      name, size, slot, numUniforms, uniformsOffset, layoutHash
+    uniform:    name, type, offset, size, count
+'''
+import struct
+from util import perfecthash, outfile
+
+VERSION = 3
+MAGIC = b'SHDB'
+NO_STRING = 0xFFFFFFFF
+HEADER_SIZE = 64
+PAYLOAD_ALIGN = 16
+
+#-------------------------------------------------------------------------------
+class Variant :
+    '''
+    One slang of a shader, the reflection lists hold tuples of
+    integers, with strings where the format stores string offsets.
+    '''
+    def __init__(self, entry, payload, isBinary) :
+        self.entry = entry
+        self.payload = payload
+        self.isBinary = isBinary
+        self.inputs = []        # (type, slot, name)
+        self.textures = []      # (type, slot, name)
+        self.blocks = []        # (name, size, slot, [(name, type, offset, size, count)], layoutHash)
+
+#-------------------------------------------------------------------------------
+class Writer :
+    def __init__(self, slangTypes) :
+        self.slangTypes = slangTypes
+        self.programs = []      # (name, id, vsIndex, fsIndex)
+        self.shaders = []       # (name, type, [Variant per slang])
+        self.strings = bytearray()
+        self.stringOffsets = {}
+
+    def addProgram(self, name, id, vsIndex, fsIndex) :
+        self.programs.append((name, id, vsIndex, fsIndex))
+
+    def addShader(self, name, type, variants) :
+        '''
+        Add a shader with one Variant per slang, returns the shader index.
+        '''
+        self.shaders.append((name, type, variants))
+        return len(self.shaders) - 1
+
+    def addString(self, s) :
+        '''
+        Return the offset of a string in the string table (each string
+        is only stored once).
+        '''
+        if s is None :
+            return None
+        if s not in self.stringOffsets :
+            self.stringOffsets[s] = len(self.strings)
+            self.strings += s.encode('utf-8') + b'\0'
+        return self.stringOffsets[s]
+
+    def getData(self) :
+        '''
+        Return the bundle file content.
+        '''
+        variants = [v for _, _, shaderVariants in self.shaders for v in shaderVariants]
+        numInputs = sum(len(v.inputs) for v in variants)
+        numTextures = sum(len(v.textures) for v in variants)
+        numBlocks = sum(len(v.blocks) for v in variants)
+        numUniforms = sum(len(b[3]) for v in variants for b in v.blocks)
+
+        # section offsets
+        slangsOffset = HEADER_SIZE
+        programsOffset = slangsOffset + 4 * len(self.slangTypes)
+        hashOffset = programsOffset + 16 * len(self.programs)
+        shadersOffset = hashOffset + 8 * len(self.programs)
+        inputsOffset = shadersOffset + (8 + 40 * len(self.slangTypes)) * len(self.shaders)
+        texturesOffset = inputsOffset + 12 * numInputs
+        blocksOffset = texturesOffset + 12 * numTextures
+        uniformsOffset = blocksOffset + 24 * numBlocks
+        stringsOffset = uniformsOffset + 20 * numUniforms
+
+        # the string table must be complete before string offsets can be
+        # resolved, and before the payload offsets are known
+        for name, _, _, _ in self.programs :
+            self.addString(name)
+        for name, _, shaderVariants in self.shaders :
+            self.addString(name)
+            for v in shaderVariants :
+                self.addString(v.entry)
+                for item in v.inputs + v.textures :
+                    self.addString(item[2])
+                for block in v.blocks :
+                    self.addString(block[0])
+                    for uniform in block[3] :
+                        self.addString(uniform[0])
+        def stringOffset(s) :
+            return NO_STRING if s is None else stringsOffset + self.stringOffsets[s]
+        payloadsOffset = stringsOffset + len(self.strings)
+
+        # payloads, each aligned to 16 bytes, identical payloads
+        # are only stored once
+        payloads = bytearray()
+        payloadOffsets = []
+        uniquePayloads = {}
+        for v in variants :
+            key = (v.isBinary, v.payload)
+            if key not in uniquePayloads :
+                payloads += b'\0' * (-(payloadsOffset + len(payloads)) % PAYLOAD_ALIGN)
+                uniquePayloads[key] = payloadsOffset + len(payloads)
+                payloads += v.payload
+                if not v.isBinary :
+                    payloads += b'\0'
+            payloadOffsets.append(uniquePayloads[key])
+        fileSize = payloadsOffset + len(payloads)
+
+        out = bytearray()
+        out += MAGIC
+        out += struct.pack('<15I', VERSION, fileSize, len(self.slangTypes), len(self.programs),
+            len(self.shaders), numInputs, numTextures, numBlocks, numUniforms,
+            slangsOffset, programsOffset, shadersOffset, stringsOffset, len(self.strings), hashOffset)
+        for slangType in self.slangTypes :
+            out += struct.pack('<I', slangType)
+        for name, id, vsIndex, fsIndex in self.programs :
+            out += struct.pack('<4I', stringOffset(name), id, vsIndex, fsIndex)
+        seeds, indices = perfecthash.build([p[0] for p in self.programs])
+        out += struct.pack('<{}I'.format(2 * len(self.programs)), *(seeds + indices))
+        inputs = bytearray()
+        textures = bytearray()
+        blocks = bytearray()
+        uniforms = bytearray()
+        variantIndex = 0
+        for name, type, shaderVariants in self.shaders :
+            out += struct.pack('<2I', stringOffset(name), type)
+            for v in shaderVariants :
+                out += struct.pack('<10I', stringOffset(v.entry), payloadOffsets[variantIndex], len(v.payload),
+                    1 if v.isBinary else 0,
+                    len(v.inputs), inputsOffset + len(inputs),
+                    len(v.textures), texturesOffset + len(textures),
+                    len(v.blocks), blocksOffset + len(blocks))
+                variantIndex += 1
+                for inputType, slot, inputName in v.inputs :
+                    inputs += struct.pack('<3I', inputType, slot, stringOffset(inputName))
+                for texType, slot, texName in v.textures :
+                    textures += struct.pack('<3I', texType, slot, stringOffset(texName))
+                for blockName, size, slot, members, layoutHash in v.blocks :
+                    blocks += struct.pack('<6I', stringOffset(blockName), size, slot, len(members), uniformsOffset + len(uniforms), layoutHash)
+                    for m in members :
+                        uniforms += struct.pack('<5I', stringOffset(m[0]), m[1], m[2], m[3], m[4])
+        out += inputs + textures + blocks + uniforms + self.strings + payloads
+        assert len(out) == fileSize
+        return bytes(out)
+
+    def write(self, path) :
+        outfile.writeIfChanged(path, self.getData())
+
+#-------------------------------------------------------------------------------
+HEADER = '''
+SHD_API int shd_open_bundle(const char *path);
+SHD_API int shd_load_bundle(const void *data, unsigned int size);
+SHD_API void shd_close_bundle(void);
+'''
+
+#-------------------------------------------------------------------------------
+def getReader() :
+    '''
+    Return the C source of the bundle reader, which implements the
+    shd_get_programs() API on top of a bundle file.
+    '''
+    return '#define SHD_BUNDLE_VERSION {}\n'.format(VERSION) + READER
+
+READER = '''#include <stdlib.h>
+#include <string.h>
+#if defined(_WIN32)
+#include <windows.h>
+#else
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <fcntl.h>
+#include <unistd.h>
+#endif
+
+/* shader bundle reader, payloads and strings are used in place */
+static struct {
+    const unsigned char *data;
+    unsigned int size;
+    int mapped;
+#if defined(_WIN32)
+    HANDLE file;
+    HANDLE mapping;
+#endif
+    void *arena;
+    int numSlangs;
+    enum SHD_SHADER_TARGET_TYPE *slangs;
+    int numPrograms;
+    shd_program *programs;
+    unsigned int hashOffset;
+    unsigned int stringsOffset;
+    unsigned int stringsSize;
+    int badString;
+} shd__bundle;
+
+static unsigned int shd__u32(unsigned int offset) {
+    const unsigned char *p = shd__bundle.data + offset;
+    return p[0] | (p[1] << 8) | (p[2] << 16) | ((unsigned int)p[3] << 24);
+}
+
+''' + perfecthash.HASH_SOURCE + '''
+/* strings must be zero-terminated inside the string table, shd__load()
+   fails if any string isn't (badString) */
+static char *shd__str(unsigned int offset) {
+    const unsigned char *str;
+    if (offset == 0xFFFFFFFF) {
+        return 0;
+    }
+    if ((offset < shd__bundle.stringsOffset) || (offset - shd__bundle.stringsOffset >= shd__bundle.stringsSize)) {
+        shd__bundle.badString = 1;
+        return 0;
+    }
+    str = shd__bundle.data + offset;
+    if (!memchr(str, 0, shd__bundle.stringsSize - (offset - shd__bundle.stringsOffset))) {
+        shd__bundle.badString = 1;
+        return 0;
+    }
+    return (char *) str;
+}
+
+static int shd__in_bounds(unsigned int offset, unsigned int count, unsigned int itemSize) {
+    return (offset <= shd__bundle.size) && (count <= (shd__bundle.size - offset) / itemSize);
+}
+
+SHD_API void shd_close_bundle(void) {
+    free(shd__bundle.arena);
+    if (shd__bundle.mapped) {
+#if defined(_WIN32)
+        UnmapViewOfFile(shd__bundle.data);
+        CloseHandle(shd__bundle.mapping);
+        CloseHandle(shd__bundle.file);
+#else
+        munmap((void *) shd__bundle.data, shd__bundle.size);
+#endif
+    }
+    memset(&shd__bundle, 0, sizeof(shd__bundle));
+}
+
+static int shd__load_failed(void) {
+    free(shd__bundle.arena);
+    shd__bundle.arena = 0;
+    shd__bundle.numSlangs = 0;
+    shd__bundle.numPrograms = 0;
+    return 0;
+}
+
+static int shd__load(const void *data, unsigned int size) {
+    unsigned int numSlangs, numPrograms, numShaders, numInputs, numTextures, numBlocks, numUniforms;
+    unsigned int slangsOffset, programsOffset, shadersOffset, hashOffset;
+    unsigned int s, i, j, k;
+    unsigned char *arena;
+    shd_shader *shaders;
+    shd_input *inputs, *inputsEnd;
+    shd_texture *textures, *texturesEnd;
+    shd_uniform_block *blocks, *blocksEnd;
+    shd_uniform *uniforms, *uniformsEnd;
+    shd__bundle.data = (const unsigned char *) data;
+    shd__bundle.size = size;
+    shd__bundle.badString = 0;
+    if ((size < 64) || (memcmp(data, "SHDB", 4) != 0) || (shd__u32(4) != SHD_BUNDLE_VERSION) || (shd__u32(8) != size)) {
+        return shd__load_failed();
+    }
+    numSlangs = shd__u32(12);
+    numPrograms = shd__u32(16);
+    numShaders = shd__u32(20);
+    numInputs = shd__u32(24);
+    numTextures = shd__u32(28);
+    numBlocks = shd__u32(32);
+    numUniforms = shd__u32(36);
+    slangsOffset = shd__u32(40);
+    programsOffset = shd__u32(44);
+    shadersOffset = shd__u32(48);
+    shd__bundle.stringsOffset = shd__u32(52);
+    shd__bundle.stringsSize = shd__u32(56);
+    hashOffset = shd__u32(60);
+    /* the totals can't be bigger than the records in the file, this also
+       keeps the arena size from overflowing */
+    if ((numSlangs == 0) ||
+        !shd__in_bounds(slangsOffset, numSlangs, 4) ||
+        !shd__in_bounds(programsOffset, numPrograms, 16) ||
+        !shd__in_bounds(hashOffset, numPrograms, 8) ||
+        !shd__in_bounds(shadersOffset, numShaders, 8 + 40 * numSlangs) ||
+        !shd__in_bounds(shd__bundle.stringsOffset, shd__bundle.stringsSize, 1) ||
+        !shd__in_bounds(0, numInputs, 12) ||
+        !shd__in_bounds(0, numTextures, 12) ||
+        !shd__in_bounds(0, numBlocks, 24) ||
+        !shd__in_bounds(0, numUniforms, 20)) {
+        return shd__load_failed();
+    }
+    /* the structs with pointers are built once, in a single allocation */
+    arena = (unsigned char *) calloc(1,
+        sizeof(shd_program) * numPrograms * numSlangs +
+        sizeof(shd_shader) * numShaders * numSlangs +
+        sizeof(shd_uniform_block) * numBlocks +
+        sizeof(shd_uniform) * numUniforms +
+        sizeof(shd_input) * numInputs +
+        sizeof(shd_texture) * numTextures +
+        sizeof(enum SHD_SHADER_TARGET_TYPE) * numSlangs);
+    if (!arena) {
+        return shd__load_failed();
+    }
+    shd__bundle.arena = arena;
+    shd__bundle.programs = (shd_program *) arena;
+    shaders = (shd_shader *) (shd__bundle.programs + numPrograms * numSlangs);
+    blocks = (shd_uniform_block *) (shaders + numShaders * numSlangs);
+    uniforms = (shd_uniform *) (blocks + numBlocks);
+    inputs = (shd_input *) (uniforms + numUniforms);
+    textures = (shd_texture *) (inputs + numInputs);
+    shd__bundle.slangs = (enum SHD_SHADER_TARGET_TYPE *) (textures + numTextures);
+    /* the records may only use as many entries as the header totals */
+    inputsEnd = inputs + numInputs;
+    texturesEnd = textures + numTextures;
+    blocksEnd = blocks + numBlocks;
+    uniformsEnd = uniforms + numUniforms;
+    shd__bundle.numSlangs = (int) numSlangs;
+    shd__bundle.numPrograms = (int) numPrograms;
+    for (s = 0; s < numSlangs; s++) {
+        shd__bundle.slangs[s] = (enum SHD_SHADER_TARGET_TYPE) shd__u32(slangsOffset + 4 * s);
+    }
+    for (i = 0; i < numShaders; i++) {
+        unsigned int shaderOffset = shadersOffset + i * (8 + 40 * numSlangs);
+        for (s = 0; s < numSlangs; s++) {
+            unsigned int v = shaderOffset + 8 + 40 * s;
+            unsigned int payload = shd__u32(v + 4);
+            unsigned int payloadSize = shd__u32(v + 8);
+            unsigned int inputCount = shd__u32(v + 16), inputsOffset = shd__u32(v + 20);
+            unsigned int textureCount = shd__u32(v + 24), texturesOffset = shd__u32(v + 28);
+            unsigned int blockCount = shd__u32(v + 32), blocksOffset = shd__u32(v + 36);
+            unsigned int isBinary = shd__u32(v + 12);
+            shd_shader *shd = &shaders[i * numSlangs + s];
+            if (!shd__in_bounds(payload, payloadSize, 1) ||
+                !shd__in_bounds(inputsOffset, inputCount, 12) ||
+                !shd__in_bounds(texturesOffset, textureCount, 12) ||
+                !shd__in_bounds(blocksOffset, blockCount, 24) ||
+                (inputCount > (unsigned int) (inputsEnd - inputs)) ||
+                (textureCount > (unsigned int) (texturesEnd - textures)) ||
+                (blockCount > (unsigned int) (blocksEnd - blocks))) {
+                return shd__load_failed();
+            }
+            /* text payloads are zero-terminated after payloadSize */
+            if (!isBinary && ((payload + payloadSize >= size) || (shd__bundle.data[payload + payloadSize] != 0))) {
+                return shd__load_failed();
+            }
+            shd->targetType = shd__bundle.slangs[s];
+            shd->type = (enum SHD_SHADER_TYPE) shd__u32(shaderOffset + 4);
+            shd->name = shd__str(shd__u32(shaderOffset));
+            shd->entry = shd__str(shd__u32(v));
+            shd->size = (int) payloadSize;
+            if (isBinary) {
+                shd->binary = (unsigned char *) (shd__bundle.data + payload);
+            }
+            else {
+                shd->source = (char *) (shd__bundle.data + payload);
+            }
+            shd->inputCount = (int) inputCount;
+            shd->inputs = inputCount ? inputs : 0;
+            for (j = 0; j < inputCount; j++, inputs++) {
+                inputs->type = (enum SHD_INPUT_TYPE) shd__u32(inputsOffset + 12 * j);
+                inputs->slot = (int) shd__u32(inputsOffset + 12 * j + 4);
+                inputs->name = shd__str(shd__u32(inputsOffset + 12 * j + 8));
+            }
+            shd->textureCount = (int) textureCount;
+            shd->textures = textureCount ? textures : 0;
+            for (j = 0; j < textureCount; j++, textures++) {
+                textures->type = (enum SHD_SAMPLER_TYPE) shd__u32(texturesOffset + 12 * j);
+                textures->slot = (int) shd__u32(texturesOffset + 12 * j + 4);
+                textures->name = shd__str(shd__u32(texturesOffset + 12 * j + 8));
+            }
+            shd->uniformBlockCount = (int) blockCount;
+            shd->uniformBlocks = blockCount ? blocks : 0;
+            for (j = 0; j < blockCount; j++, blocks++) {
+                unsigned int b = blocksOffset + 24 * j;
+                unsigned int uniformCount = shd__u32(b + 12), uniformsOffset = shd__u32(b + 16);
+                if (!shd__in_bounds(uniformsOffset, uniformCount, 20) ||
+                    (uniformCount > (unsigned int) (uniformsEnd - uniforms))) {
+                    return shd__load_failed();
+                }
+                blocks->name = shd__str(shd__u32(b));
+                blocks->size = (int) shd__u32(b + 4);
+                blocks->slot = (int) shd__u32(b + 8);
+                blocks->count = (int) uniformCount;
+                blocks->uniforms = uniforms;
+                blocks->layoutHash = shd__u32(b + 20);
+                for (k = 0; k < uniformCount; k++, uniforms++) {
+                    unsigned int u = uniformsOffset + 20 * k;
+                    uniforms->name = shd__str(shd__u32(u));
+                    uniforms->type = (enum SHD_UNIFORM_TYPE) shd__u32(u + 4);
+                    uniforms->offset = (int) shd__u32(u + 8);
+                    uniforms->size = (int) shd__u32(u + 12);
+                    uniforms->count = (int) shd__u32(u + 16);
+                }
+            }
+        }
+    }
+    for (i = 0; i < numPrograms; i++) {
+        if (shd__u32(hashOffset + 4 * (numPrograms + i)) >= numPrograms) {
+            return shd__load_failed();
+        }
+    }
+    shd__bundle.hashOffset = hashOffset;
+    for (s = 0; s < numSlangs; s++) {
+        for (i = 0; i < numPrograms; i++) {
+            unsigned int p = programsOffset + 16 * i;
+            unsigned int vs = shd__u32(p + 8), fs = shd__u32(p + 12);
+            shd_program *prog = &shd__bundle.programs[s * numPrograms + i];
+            if ((vs >= numShaders) || (fs >= numShaders)) {
+                return shd__load_failed();
+            }
+            prog->name = shd__str(shd__u32(p));
+            prog->id = (enum SHD_PROGRAMS) shd__u32(p + 4);
+            prog->vs = shaders[vs * numSlangs + s];
+            prog->fs = shaders[fs * numSlangs + s];
+        }
+    }
+    if (shd__bundle.badString) {
+        return shd__load_failed();
+    }
+    return 1;
+}
+
+SHD_API int shd_load_bundle(const void *data, unsigned int size) {
+    shd_close_bundle();
+    return shd__load(data, size);
+}
+
+SHD_API int shd_open_bundle(const char *path) {
+    const void *data = 0;
+    unsigned int size = 0;
+    shd_close_bundle();
+#if defined(_WIN32)
+    shd__bundle.file = CreateFileA(path, GENERIC_READ, FILE_SHARE_READ, 0, OPEN_EXISTING, FILE_ATTRIBUTE_NORMAL, 0);
+    if (shd__bundle.file == INVALID_HANDLE_VALUE) {
+        return 0;
+    }
+    size = GetFileSize(shd__bundle.file, 0);
+    shd__bundle.mapping = CreateFileMappingA(shd__bundle.file, 0, PAGE_READONLY, 0, 0, 0);
+    if (shd__bundle.mapping) {
+        data = MapViewOfFile(shd__bundle.mapping, FILE_MAP_READ, 0, 0, 0);
+    }
+    if (!data) {
+        if (shd__bundle.mapping) {
+            CloseHandle(shd__bundle.mapping);
+        }
+        CloseHandle(shd__bundle.file);
+        memset(&shd__bundle, 0, sizeof(shd__bundle));
+        return 0;
+    }
+#else
+    struct stat st;
+    int fd = open(path, O_RDONLY);
+    if (fd < 0) {
+        return 0;
+    }
+    if ((fstat(fd, &st) != 0) || (st.st_size <= 0)) {
+        close(fd);
+        return 0;
+    }
+    size = (unsigned int) st.st_size;
+    data = mmap(0, size, PROT_READ, MAP_PRIVATE, fd, 0);
+    close(fd);
+    if (data == MAP_FAILED) {
+        return 0;
+    }
+#endif
+    shd__bundle.mapped = 1;
+    if (!shd__load(data, size)) {
+        shd_close_bundle();
+        return 0;
+    }
+    return 1;
+}
+
+SHD_API const shd_program_collection shd_get_programs(enum SHD_SHADER_TARGET_TYPE type) {
+    shd_program_collection collection = { 0, 0 };
+    int s;
+    for (s = 0; s < shd__bundle.numSlangs; s++) {
+        if ((type == SHD_SHADER_TARGET_TYPE_DEFAULT) || (shd__bundle.slangs[s] == type)) {
+            collection.count = shd__bundle.numPrograms;
+            collection.programs = &shd__bundle.programs[s * shd__bundle.numPrograms];
+            break;
+        }
+    }
+    return collection;
+}
+
+SHD_API const shd_program *shd_get_program_by_id(enum SHD_PROGRAMS id, enum SHD_SHADER_TARGET_TYPE type) {
+    shd_program_collection collection = shd_get_programs(type);
+    return ((int) id >= 1 && (int) id <= collection.count) ? &collection.programs[id - 1] : 0;
+}
+
+SHD_API const shd_program *shd_find_program(const char *name, enum SHD_SHADER_TARGET_TYPE type) {
+    shd_program_collection collection = shd_get_programs(type);
+    unsigned int n = (unsigned int) collection.count;
+    unsigned int h, seed, index;
+    if (!name || (n == 0)) {
+        return 0;
+    }
+    h = shd__crc32(name);
+    seed = shd__u32(shd__bundle.hashOffset + 4 * (shd__mix(h) % n));
+    index = shd__u32(shd__bundle.hashOffset + 4 * (n + shd__mix(h ^ seed) % n));
+    return (strcmp(collection.programs[index].name, name) == 0) ? &collection.programs[index] : 0;
+}
+
+SHD_API const enum SHD_SHADER_TARGET_TYPE *shd_get_slangs(int *count) {
+    *count = shd__bundle.numSlangs;
+    return shd__bundle.slangs;
+}
+
+SHD_API enum SHD_SHADER_TARGET_TYPE shd_get_default_slang() {
+    return shd__bundle.numSlangs ? shd__bundle.slangs[0] : SHD_SHADER_TARGET_TYPE_DEFAULT;
+}
+'''
@@ -0,0 +1,172 @@
+'''
+Content-addressed on-disk cache for compiled shaders.
+
+Each cache entry is a directory named after the hash of everything
+that goes into compiling a shader (expanded source, stage, slangs,
+compiler args and tool binaries), and holds copies of the files
+produced by the compilers. Entries are evicted least-recently-used
+first when the cache grows too big, or when they are too old.
+'''
+import os, sys, shutil, hashlib, time, threading
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024    # bytes
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60     # seconds
+
+fileHashes = {}
+fileHashesLock = threading.Lock()
+
+#-------------------------------------------------------------------------------
+def hashFile(path) :
+    '''
+    Return the sha1 hex digest of a file's content (e.g. a tool binary),
+    memoized by path, size and modification time. Returns an
+    empty string if the file doesn't exist.
+    '''
+    try :
+        st = os.stat(path)
+    except OSError :
+        return ''
+    key = (path, st.st_size, st.st_mtime)
+    with fileHashesLock :
+        if key in fileHashes :
+            return fileHashes[key]
+    h = hashlib.sha1()
+    with open(path, 'rb') as f :
+        for chunk in iter(lambda: f.read(1 << 20), b'') :
+            h.update(chunk)
+    digest = h.hexdigest()
+    with fileHashesLock :
+        fileHashes[key] = digest
+    return digest
+
+#-------------------------------------------------------------------------------
+def hashItems(items) :
+    '''
+    Return the sha1 hex digest over a list of strings.
+    '''
+    h = hashlib.sha1()
+    for item in items :
+        data = item.encode('utf-8')
+        # prefix each item with its length so that item boundaries matter
+        h.update('{}:'.format(len(data)).encode('ascii'))
+        h.update(data)
+    return h.hexdigest()
+
+#-------------------------------------------------------------------------------
+def getDefaultDir() :
+    if 'SHD_CACHE_DIR' in os.environ :
+        return os.environ['SHD_CACHE_DIR']
+    if sys.platform == 'win32' and 'LOCALAPPDATA' in os.environ :
+        return os.path.join(os.environ['LOCALAPPDATA'], 'shd', 'cache')
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'shd')
+
+#-------------------------------------------------------------------------------
+def fromArgs(args) :
+    '''
+    Create a Cache object from the generator args, returns None
+    if caching has been disabled with "cache: 'false'".
+    Cache location and limits can be overridden with the
+    SHD_CACHE_DIR, SHD_CACHE_SIZE (in MBytes) and SHD_CACHE_AGE
+    (in days) environment variables.
+    '''
+    if str(args.get('cache', '')).lower() == 'false' :
+        return None
+    cacheDir = getDefaultDir()
+    if not cacheDir :
+        return None
+    maxSize = DEFAULT_MAX_SIZE
+    maxAge = DEFAULT_MAX_AGE
+    if os.environ.get('SHD_CACHE_SIZE') :
+        maxSize = int(float(os.environ['SHD_CACHE_SIZE']) * 1024 * 1024)
+    if os.environ.get('SHD_CACHE_AGE') :
+        maxAge = int(float(os.environ['SHD_CACHE_AGE']) * 24 * 60 * 60)
+    return Cache(cacheDir, maxSize, maxAge)
+
+#-------------------------------------------------------------------------------
+class Cache :
+    def __init__(self, dir, maxSize=DEFAULT_MAX_SIZE, maxAge=DEFAULT_MAX_AGE) :
+        self.dir = dir
+        self.maxSize = maxSize
+        self.maxAge = maxAge
+
+    def entryPath(self, key) :
+        return os.path.join(self.dir, key[:2], key)
+
+    def fetch(self, key, files) :
+        '''
+        Copy the cached files of an entry to their destinations, files
+        is a dictionary of file names in the entry to destination paths.
+        Returns False on a cache miss.
+        '''
+        entry = self.entryPath(key)
+        try :
+            for name, dst in files.items() :
+                shutil.copyfile(os.path.join(entry, name), dst)
+            # bump the entry for the least-recently-used eviction
+            os.utime(entry, None)
+        except (IOError, OSError) :
+            return False
+        return True
+
+    def store(self, key, files) :
+        '''
+        Store files in a new cache entry, files is a dictionary of
+        file names in the entry to source paths. The entry is written
+        to a temporary directory first, and renamed into place so that
+        concurrent builds never see incomplete entries.
+        '''
+        entry = self.entryPath(key)
+        if os.path.isdir(entry) :
+            return
+        tmp = '{}.tmp{}.{}'.format(entry, os.getpid(), threading.current_thread().ident)
+        try :
+            os.makedirs(tmp)
+            for name, src in files.items() :
+                shutil.copyfile(src, os.path.join(tmp, name))
+            os.rename(tmp, entry)
+        except (IOError, OSError) :
+            # another build might have stored the same entry
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def evict(self) :
+        '''
+        Remove entries which haven't been used for longer than maxAge,
+        and the least-recently-used entries until the cache is smaller
+        than maxSize.
+        '''
+        if not os.path.isdir(self.dir) :
+            return
+        now = time.time()
+        entries = []
+        totalSize = 0
+        for bucket in os.listdir(self.dir) :
+            bucketPath = os.path.join(self.dir, bucket)
+            if not os.path.isdir(bucketPath) :
+                continue
+            for key in os.listdir(bucketPath) :
+                entry = os.path.join(bucketPath, key)
+                try :
+                    mtime = os.stat(entry).st_mtime
+                    size = 0
+                    for name in os.listdir(entry) :
+                        size += os.stat(os.path.join(entry, name)).st_size
+                except OSError :
+                    continue
+                if '.tmp' in key :
+                    # leftover of a crashed build
+                    if now - mtime > 60 * 60 :
+                        shutil.rmtree(entry, ignore_errors=True)
+                    continue
+                if now - mtime > self.maxAge :
+                    shutil.rmtree(entry, ignore_errors=True)
+                    continue
+                entries.append((mtime, size, entry))
+                totalSize += size
+        if totalSize > self.maxSize :
+            entries.sort()
+            for mtime, size, entry in entries :
+                if totalSize <= self.maxSize :
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                totalSize -= size
@@ -0,0 +1,76 @@
+'''
+Scanner for the interface declarations of a shader source.
+
+Finds the 'in' and 'out' variables and the members of uniform blocks
+in the (comment-stripped) source lines of a shader, so that interface
+errors can be found before any compiler runs. Only declarations with
+one variable per line are recognized, which is how shd shaders are
+written; the reflection data of the compiled shaders is still
+validated afterwards.
+'''
+import re
+
+QUALIFIERS = r'(?:(?:layout\s*\([^)]*\)|flat|smooth|noperspective|centroid|lowp|mediump|highp)\s+)*'
+inOutRegex = re.compile(r'^' + QUALIFIERS + r'(in|out)\s+' + QUALIFIERS + r'(\w+)\s+(\w+)\s*(?:\[\s*(\w+)\s*\])?\s*;')
+blockRegex = re.compile(r'^(?:layout\s*\([^)]*\)\s*)?uniform\s+(\w+)\s*(\{)?\s*$')
+memberRegex = re.compile(r'^' + QUALIFIERS + r'(\w+)\s+(\w+)\s*(?:\[\s*(\w+)\s*\])?\s*;')
+
+#-------------------------------------------------------------------------------
+class Variable :
+    def __init__(self, type, name, num, line) :
+        self.type = type
+        self.name = name
+        self.num = num          # 1 for non-arrays, 0 if the size isn't a number
+        self.line = line
+
+#-------------------------------------------------------------------------------
+class Declarations :
+    def __init__(self) :
+        self.inputs = {}        # name => Variable
+        self.outputs = {}       # name => Variable
+        self.blocks = []        # (name, line, [Variable])
+
+#-------------------------------------------------------------------------------
+def getNum(size) :
+    if size is None :
+        return 1
+    return int(size) if size.isdigit() else 0
+
+#-------------------------------------------------------------------------------
+def scan(lines) :
+    '''
+    Scan a sequence of Lines, returns a Declarations object.
+    '''
+    decl = Declarations()
+    block = None
+    inBlock = False
+    for line in lines :
+        content = line.content
+        if not content :
+            continue
+        if block is not None :
+            if not inBlock :
+                # the block's opening brace is on the next line
+                inBlock = content.startswith('{')
+                if not inBlock :
+                    block = None
+                continue
+            if content.startswith('}') :
+                block = None
+                inBlock = False
+                continue
+            m = memberRegex.match(content)
+            if m :
+                block[2].append(Variable(m.group(1), m.group(2), getNum(m.group(3)), line))
+            continue
+        m = inOutRegex.match(content)
+        if m :
+            vars = decl.inputs if m.group(1) == 'in' else decl.outputs
+            vars[m.group(3)] = Variable(m.group(2), m.group(3), getNum(m.group(4)), line)
+            continue
+        m = blockRegex.match(content)
+        if m :
+            block = (m.group(1), line, [])
+            inBlock = m.group(2) is not None
+            decl.blocks.append(block)
+    return decl
@@ -0,0 +1,136 @@
+'''
+Embed binary and text payloads (compiled shader binaries, shader
+sources) into generated C sources.
+
+Payloads are converted in bulk (whole-buffer table lookups and
+joins instead of one format call per byte), so that multi-megabyte
+metallibs and DXBC blobs can be embedded quickly. Three output modes
+are supported:
+
+    array   - a C array initializer (0x00,0x01,...), works everywhere
+    string  - an escaped C string literal, compiles much faster than an
+              array, but MSVC limits string literals to 64 KBytes
+    incbin  - an assembler .incbin directive which references the payload
+              file, the C compiler doesn't need to parse the data at all
+              (GCC and Clang only)
+
+Each payload is defined as a static (or for incbin, hidden global) array
+'name' and an enum constant 'name_size' with the payload size in bytes
+(so that it can be used in static initializers), text payloads are
+zero-terminated (not included in the size).
+'''
+import os
+import genutil as util
+
+MODES = ['array', 'string', 'incbin']
+
+BYTES_PER_ROW = 16          # for the array mode
+BYTES_PER_LITERAL = 64      # for the string mode
+
+# 0x00, 0x01, ... for each byte value
+arrayTable = ['0x{:02x},'.format(i) for i in range(256)]
+
+# printable ASCII characters as is, all other bytes as 3-digit octal
+# escapes (so that a following digit can't extend the escape sequence),
+# '?' is escaped to prevent trigraphs
+stringTable = {}
+for i in range(256) :
+    if i < 32 or i > 126 :
+        stringTable[i] = '\\{:03o}'.format(i)
+stringTable[ord('"')] = '\\"'
+stringTable[ord('\\')] = '\\\\'
+stringTable[ord('?')] = '\\?'
+
+# GCC doesn't know which section a top-level asm statement ends in, so the
+# previous section must be restored (clang emits top-level asm separately)
+INCBIN_PREAMBLE = '''#if !defined(SHD_INCBIN_SECTION)
+#if defined(_MSC_VER)
+#error "shader payloads embedded with .incbin require GCC or Clang"
+#elif defined(__APPLE__)
+#define SHD_INCBIN_SECTION ".const_data\\n"
+#define SHD_INCBIN_END ".text\\n"
+#define SHD_INCBIN_LABEL(name) ".globl _" name "\\n.private_extern _" name "\\n_" name ":\\n"
+#else
+#define SHD_INCBIN_SECTION ".pushsection .rodata\\n"
+#define SHD_INCBIN_END ".popsection\\n"
+#define SHD_INCBIN_LABEL(name) ".globl " name "\\n.hidden " name "\\n" name ":\\n"
+#endif
+#endif
+'''
+
+#-------------------------------------------------------------------------------
+def getMode(args) :
+    '''
+    Return the embed mode from the generator args ("embed: 'string'"),
+    or None for the defaults (C arrays for binaries, string literals
+    for text).
+    '''
+    mode = args.get('embed') or None
+    if mode is not None and mode not in MODES :
+        util.fmtError("invalid embed mode '{}' (must be one of {})".format(mode, ', '.join(MODES)))
+    return mode
+
+#-------------------------------------------------------------------------------
+def formatArray(data) :
+    '''
+    Return the C array initializer for a bytes object, 16 bytes per row.
+    '''
+    items = ''.join(map(arrayTable.__getitem__, bytearray(data)))
+    # each item is exactly 5 characters
+    rowLength = BYTES_PER_ROW * 5
+    return '\n'.join([items[i:i+rowLength] for i in range(0, len(items), rowLength)])
+
+#-------------------------------------------------------------------------------
+def formatString(data, isText) :
+    '''
+    Return a bytes object as a sequence of adjacent C string literals.
+    Text is split after newlines (so that shader sources stay readable
+    in the generated file), binary data into fixed-size pieces.
+    '''
+    text = data.decode('latin-1')
+    if isText :
+        pieces = text.splitlines(True)
+    else :
+        pieces = [text[i:i+BYTES_PER_LITERAL] for i in range(0, len(text), BYTES_PER_LITERAL)]
+    if not pieces :
+        return '""'
+    return '\n'.join('"{}"'.format(piece.translate(stringTable)) for piece in pieces)
+
+#-------------------------------------------------------------------------------
+def getDefinition(c_name, data, mode, path, isText) :
+    '''
+    Return the C definition of a payload, path is the file which
+    contains the payload data (only used by the incbin mode).
+    '''
+    size = len(data)
+    c_type = 'char' if isText else 'unsigned char'
+    if mode == 'incbin' :
+        asm = [
+            '__asm__(',
+            '    SHD_INCBIN_SECTION',
+            '    ".balign 16\\n"',
+            '    SHD_INCBIN_LABEL("{}")'.format(c_name),
+            '    ".incbin \\"{}\\"\\n"'.format(os.path.abspath(path).replace('\\', '/')),
+        ]
+        if isText :
+            asm.append('    ".byte 0\\n"')
+        asm.append('    SHD_INCBIN_END);')
+        asm.append('extern const {} {}[];'.format(c_type, c_name))
+        body = '\n'.join(asm)
+    elif mode == 'string' :
+        body = 'static const {} {}[{}] =\n{};'.format(c_type, c_name, size + 1, formatString(data, isText))
+    else :
+        if isText :
+            data += b'\0'
+        body = 'static const {} {}[{}] = {{\n{}\n}};'.format(c_type, c_name, len(data), formatArray(data))
+    return '{}\nenum {{ {}_size = {} }};\n'.format(body, c_name, size)
+
+#-------------------------------------------------------------------------------
+def writePreamble(f, mode) :
+    '''
+    Write the definitions needed by the payloads of an embed mode,
+    must be called once before the payloads are written.
+    '''
+    if mode == 'incbin' :
+        f.write(INCBIN_PREAMBLE)
+
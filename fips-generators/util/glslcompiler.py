@@ -2,15 +2,10 @@
 Simple python wrapper for the GLSL reference compiler.
 '''
 
-import subprocess, platform, os, sys
+import platform, os, sys
 import genutil as util
-
-#-------------------------------------------------------------------------------
-class Line :
-    def __init__(self, content, path='', lineNumber=0) :
-        self.content = content
-        self.path = path
-        self.lineNumber = lineNumber
+from util import jobs, process, outfile
+from util.lines import Line
 
 #-------------------------------------------------------------------------------
 def getToolPath() :
@@ -35,13 +30,10 @@ def writeFile(f, lines) :
 
 #-------------------------------------------------------------------------------
 def call(cmd) :
-    child = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-    out = ''
-    while True :
-        out += bytes.decode(child.stdout.read())
-        if child.poll() != None :
-            break
-    return out
+    inv = process.run(cmd)
+    if inv.stderr :
+        sys.stderr.write(inv.stderr)
+    return inv.stdout
 
 #-------------------------------------------------------------------------------
 def parseOutput(output, lines) :
@@ -102,11 +94,12 @@ def compile(lines, type, base_path, slang, args) :
     tgt_lines.append(Line('#define ORYOL_MSL ({})'.format('1' if slang=='metal' else '0')))
     tgt_lines.append(Line('#define ORYOL_HLSL ({})'.format('1' if slang=='hlsl' else '0')))
     tgt_lines.extend(lines)
-    with open(src_path, 'w') as f:
+    with outfile.OutputFile(src_path) as f:
         writeFile(f, tgt_lines)
     cmd = [getToolPath(), '-G', '-o', dst_path, src_path]
     output = call(cmd)
-    parseOutput(output, tgt_lines)
+    with jobs.outputLock :
+        parseOutput(output, tgt_lines)
 
 #-------------------------------------------------------------------------------
 '''
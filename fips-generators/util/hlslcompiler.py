@@ -4,8 +4,9 @@ Python wrapper for HLSL compiler (fxc.exe)
 NOTE: this module contains Windows specific code and should
 only be imported when running on Windows.
 '''
-import subprocess, platform, os, sys
+import os, sys
 import genutil as util
+from util import jobs, process
 if sys.version_info[0] < 3:
     import _winreg as winreg
 else:
@@ -63,13 +64,10 @@ def callFxc(cmd) :
     call the fxc compiler and return its output
     '''
     print(cmd)
-    child = subprocess.Popen(cmd, stderr=subprocess.PIPE)
-    out = ''
-    while True :
-        out += bytes.decode(child.stderr.read())
-        if child.poll() != None :
-            break
-    return out
+    inv = process.run(cmd)
+    if inv.stdout :
+        sys.stdout.write(inv.stdout)
+    return inv.stderr
 
 #-------------------------------------------------------------------------------
 def parseOutput(output, lines) :
@@ -128,7 +126,11 @@ def parseOutput(output, lines) :
         sys.exit(10) 
 
 #-------------------------------------------------------------------------------
-def compile(lines, base_path, type, c_name, args) :
+def compile(lines, base_path, type, args) :
+    '''
+    Compile the .hlsl source into a DXBC blob (.dxbc), which
+    is embedded into the generated source.
+    '''
     fxcPath = findFxc()
     if not fxcPath :
         util.fmtError("fxc.exe not found!\n")
@@ -142,10 +144,10 @@ def compile(lines, base_path, type, c_name, args) :
         'fs': 'ps_5_0'
     }
     hlsl_src_path = base_path + '.hlsl'
-    out_path = base_path + '.hlsl.h'
+    out_path = base_path + '.dxbc'
 
     # /Gec is backward compatibility mode
-    cmd = [fxcPath, '/T', profile[type], '/Fh', out_path, '/Vn', c_name, '/Gec']
+    cmd = [fxcPath, '/T', profile[type], '/Fo', out_path, '/Gec']
     if 'debug' in args and args['debug'] == 'true' :
         cmd.extend(['/Zi', '/Od'])
     else :
@@ -153,4 +155,5 @@ def compile(lines, base_path, type, c_name, args) :
     cmd.append(hlsl_src_path)
     
     output = callFxc(cmd)
-    parseOutput(output, lines)
\ No newline at end of file
+    with jobs.outputLock :
+        parseOutput(output, lines)
\ No newline at end of file
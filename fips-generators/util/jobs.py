@@ -0,0 +1,127 @@
+'''
+Simple job graph scheduler which runs compile jobs on a bounded
+pool of worker threads.
+
+The actual work happens in external tools (glslangValidator, oryol-shdc,
+metal, fxc), so threads are sufficient to keep all cores busy.
+'''
+import os, threading
+from concurrent import futures
+from util import trace
+
+# serializes error output (util.setErrorLocation/fmtError use global
+# state), must be held while parsing and printing compiler output
+outputLock = threading.RLock()
+
+#-------------------------------------------------------------------------------
+def getDefaultNumWorkers() :
+    '''
+    One worker per CPU core.
+    '''
+    try :
+        return max(1, os.cpu_count() or 1)
+    except AttributeError :
+        import multiprocessing
+        return max(1, multiprocessing.cpu_count())
+
+#-------------------------------------------------------------------------------
+def getNumWorkers(args) :
+    '''
+    Get the number of workers from the generator args ('jobs'),
+    0 or no value means one worker per CPU core.
+    '''
+    num = args.get('jobs') if args else None
+    try :
+        num = int(num)
+    except (TypeError, ValueError) :
+        num = 0
+    if num <= 0 :
+        num = getDefaultNumWorkers()
+    return num
+
+#-------------------------------------------------------------------------------
+class Job :
+    def __init__(self, name, deps, func, args) :
+        self.name = name
+        self.deps = [dep for dep in deps if dep is not None]
+        self.func = func
+        self.args = args
+        self.dependents = []
+        self.numPending = 0
+
+    def run(self) :
+        if trace.enabled :
+            # job names are '<shader>: <step>', summarize by step
+            with trace.span(self.name, 'job', self.name.rpartition(': ')[2]) :
+                return self.func(*self.args)
+        return self.func(*self.args)
+
+#-------------------------------------------------------------------------------
+class Scheduler :
+    '''
+    Collects jobs with dependencies and runs them on a worker pool.
+    Dependencies must be added before the jobs that depend on them,
+    so that the insertion order is a valid serial execution order.
+    '''
+    def __init__(self, numWorkers=None) :
+        self.numWorkers = numWorkers or getDefaultNumWorkers()
+        self.jobs = []
+
+    def add(self, name, deps, func, *args) :
+        job = Job(name, deps, func, args)
+        self.jobs.append(job)
+        return job
+
+    def runSerial(self, jobs) :
+        for job in jobs :
+            job.run()
+
+    def runParallel(self, jobs) :
+        ready = []
+        for job in jobs :
+            job.dependents = []
+            job.numPending = len(job.deps)
+        for job in jobs :
+            for dep in job.deps :
+                dep.dependents.append(job)
+            if job.numPending == 0 :
+                ready.append(job)
+        ready.reverse()
+        failure = None
+        running = {}
+        with futures.ThreadPoolExecutor(max_workers=self.numWorkers) as pool :
+            while ready or running :
+                while ready and failure is None :
+                    job = ready.pop()
+                    running[pool.submit(job.run)] = job
+                if not running :
+                    break
+                done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                for future in done :
+                    job = running.pop(future)
+                    try :
+                        future.result()
+                    except BaseException as exc :
+                        # don't start new jobs, but let the running ones finish
+                        if failure is None :
+                            failure = exc
+                        continue
+                    for dependent in job.dependents :
+                        dependent.numPending -= 1
+                        if dependent.numPending == 0 :
+                            ready.insert(0, dependent)
+        if failure is not None :
+            raise failure
+
+    def run(self) :
+        '''
+        Run all jobs added so far, a job starts as soon as all its
+        dependencies have finished. The first failing job stops
+        starting new jobs, and its exception is re-raised.
+        '''
+        jobs = self.jobs
+        self.jobs = []
+        if self.numWorkers == 1 :
+            self.runSerial(jobs)
+        else :
+            self.runParallel(jobs)
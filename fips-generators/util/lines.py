@@ -0,0 +1,115 @@
+'''
+Source line representation shared by the parser, @include
+expansion and the compiler wrappers.
+
+The parser doesn't create an object per source line, instead all lines
+of a file are stored in a LineTable (the comment-stripped file content,
+and arrays with the line number and text offset of each line), and
+snippets reference ranges of that table. Line objects are only created
+on access.
+'''
+import sys, itertools, bisect, array
+
+#-------------------------------------------------------------------------------
+class Line :
+    '''
+    A single source line and its original location.
+    '''
+    __slots__ = ('content', 'include', 'path', 'lineNumber')
+
+    def __init__(self, content, path='', lineNumber=0) :
+        self.content = content
+        self.include = None         # name of an included block
+        self.path = path
+        self.lineNumber = lineNumber
+
+#-------------------------------------------------------------------------------
+class LineTable :
+    '''
+    The source lines of one file as offsets into the file's text,
+    leading and trailing whitespace is removed on access.
+    '''
+    def __init__(self, path, text) :
+        self.path = sys.intern(path)
+        self.text = text
+        self.lineNumbers = array.array('i')
+        self.starts = array.array('i')
+
+    def __len__(self) :
+        return len(self.lineNumbers)
+
+    def add(self, lineNumber, start) :
+        self.lineNumbers.append(lineNumber)
+        self.starts.append(start)
+
+    def content(self, index) :
+        start = self.starts[index]
+        end = self.text.find('\n', start)
+        if end == -1 :
+            end = len(self.text)
+        return self.text[start:end].strip(' \t\r')
+
+    def line(self, index) :
+        return Line(self.content(index), self.path, self.lineNumbers[index])
+
+#-------------------------------------------------------------------------------
+class LineRange :
+    '''
+    Read-only sequence of Lines for a range of a LineTable.
+    '''
+    __slots__ = ('table', 'start', 'stop')
+
+    def __init__(self, table, start, stop) :
+        self.table = table
+        self.start = start
+        self.stop = stop
+
+    def __len__(self) :
+        return self.stop - self.start
+
+    def __iter__(self) :
+        table = self.table
+        path = table.path
+        for i in range(self.start, self.stop) :
+            yield Line(table.content(i), path, table.lineNumbers[i])
+
+    def __getitem__(self, index) :
+        if index < 0 :
+            index += len(self)
+        if index < 0 or index >= len(self) :
+            raise IndexError('line index out of range')
+        return self.table.line(self.start + index)
+
+#-------------------------------------------------------------------------------
+class SourceSpans :
+    '''
+    Sequence of Lines made of spans (sequences of Lines), the expanded
+    source of a shader shares the spans of included blocks instead of
+    copying their lines.
+    '''
+    def __init__(self, spans=()) :
+        self.spans = []
+        self.starts = []
+        self.length = 0
+        for span in spans :
+            self.append(span)
+
+    def append(self, span) :
+        if len(span) > 0 :
+            self.spans.append(span)
+            self.starts.append(self.length)
+            self.length += len(span)
+
+    def __len__(self) :
+        return self.length
+
+    def __iter__(self) :
+        return itertools.chain.from_iterable(self.spans)
+
+    def __getitem__(self, index) :
+        if index < 0 :
+            index += self.length
+        if index < 0 or index >= self.length :
+            raise IndexError('line index out of range')
+        spanIndex = bisect.bisect_right(self.starts, index) - 1
+        return self.spans[spanIndex][index - self.starts[spanIndex]]
@@ -0,0 +1,167 @@
+'''
+LZ4 block compression of embedded payloads.
+
+Payloads are compressed at generation time and decompressed by the
+generated code when they are first used. The output is a standard LZ4
+block (without frame header): a sequence of
+
+    token           literal length (high 4 bits), match length - 4
+                    (low 4 bits), 15 means more length bytes follow
+    [length bytes]  added to the literal length until a byte < 255
+    literals
+    offset          2 bytes little-endian, distance back to the match
+    [length bytes]  added to the match length until a byte < 255
+
+the last sequence only has literals. The decoder (DECODE_SOURCE) is
+a few lines of C without dependencies, and decodes at memcpy speed.
+'''
+
+MIN_MATCH = 4
+LAST_LITERALS = 5           # the last 5 bytes are always literals
+MF_LIMIT = 12               # the last match must start 12 bytes before the end
+MAX_OFFSET = 65535
+SKIP_STRENGTH = 6           # search faster in incompressible data
+COMPARE_STEP = 64
+
+# C implementation of decompress() below, src must be a valid block
+# which decompresses to exactly dstSize bytes
+DECODE_SOURCE = '''static void shd__lz4_decode(const unsigned char *src, unsigned int srcSize, unsigned char *dst) {
+    const unsigned char *end = src + srcSize;
+    const unsigned char *match;
+    unsigned int token, len, b;
+    while (src < end) {
+        token = *src++;
+        len = token >> 4;
+        if (len == 15) {
+            do {
+                b = *src++;
+                len += b;
+            } while (b == 255);
+        }
+        memcpy(dst, src, len);
+        dst += len;
+        src += len;
+        if (src >= end) {
+            break;
+        }
+        match = dst - (src[0] | (src[1] << 8));
+        src += 2;
+        len = (token & 15) + 4;
+        if ((token & 15) == 15) {
+            do {
+                b = *src++;
+                len += b;
+            } while (b == 255);
+        }
+        /* the match may overlap the output, copy byte by byte */
+        while (len--) {
+            *dst++ = *match++;
+        }
+    }
+}
+'''
+
+#-------------------------------------------------------------------------------
+def writeLength(out, length) :
+    while length >= 255 :
+        out.append(255)
+        length -= 255
+    out.append(length)
+
+#-------------------------------------------------------------------------------
+def writeSequence(out, literals, offset, matchLength) :
+    '''
+    Append a sequence, matchLength is 0 for the last sequence.
+    '''
+    litLength = len(literals)
+    token = (min(litLength, 15) << 4)
+    if matchLength :
+        token |= min(matchLength - MIN_MATCH, 15)
+    out.append(token)
+    if litLength >= 15 :
+        writeLength(out, litLength - 15)
+    out += literals
+    if matchLength :
+        out.append(offset & 0xFF)
+        out.append(offset >> 8)
+        if matchLength - MIN_MATCH >= 15 :
+            writeLength(out, matchLength - MIN_MATCH - 15)
+
+#-------------------------------------------------------------------------------
+def compress(data) :
+    '''
+    Return data as LZ4 block (greedy matching against the most recent
+    occurrence of each 4-byte sequence).
+    '''
+    data = bytes(data)
+    n = len(data)
+    out = bytearray()
+    table = {}
+    anchor = 0
+    pos = 0
+    misses = 0
+    limit = n - MF_LIMIT
+    while pos < limit :
+        key = data[pos:pos+MIN_MATCH]
+        ref = table.get(key)
+        table[key] = pos
+        if ref is None or pos - ref > MAX_OFFSET :
+            misses += 1
+            pos += 1 + (misses >> SKIP_STRENGTH)
+            continue
+        misses = 0
+        # extend the match, first in chunks, then byte by byte
+        length = MIN_MATCH
+        maxLength = n - LAST_LITERALS - pos
+        while length + COMPARE_STEP <= maxLength and data[ref+length:ref+length+COMPARE_STEP] == data[pos+length:pos+length+COMPARE_STEP] :
+            length += COMPARE_STEP
+        while length < maxLength and data[ref+length] == data[pos+length] :
+            length += 1
+        # and backwards into the pending literals
+        while pos > anchor and ref > 0 and data[pos-1] == data[ref-1] :
+            pos -= 1
+            ref -= 1
+            length += 1
+        writeSequence(out, data[anchor:pos], pos - ref, length)
+        pos += length
+        anchor = pos
+    writeSequence(out, data[anchor:], 0, 0)
+    return bytes(out)
+
+#-------------------------------------------------------------------------------
+def decompress(block) :
+    '''
+    Python version of the generated decoder.
+    '''
+    block = bytearray(block)
+    out = bytearray()
+    pos = 0
+    while pos < len(block) :
+        token = block[pos]
+        pos += 1
+        length = token >> 4
+        if length == 15 :
+            while True :
+                b = block[pos]
+                pos += 1
+                length += b
+                if b != 255 :
+                    break
+        out += block[pos:pos+length]
+        pos += length
+        if pos >= len(block) :
+            break
+        offset = block[pos] | (block[pos+1] << 8)
+        pos += 2
+        length = (token & 15) + MIN_MATCH
+        if (token & 15) == 15 :
+            while True :
+                b = block[pos]
+                pos += 1
+                length += b
+                if b != 255 :
+                    break
+        start = len(out) - offset
+        for i in range(length) :
+            out.append(out[start + i])
+    return bytes(out)
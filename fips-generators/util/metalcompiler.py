@@ -1,8 +1,9 @@
 '''
 Python wrapper for metal shader compiler.
 '''
-import subprocess, os, sys, binascii
+import subprocess, os, sys
 import genutil as util
+from util import jobs, process
 
 #-------------------------------------------------------------------------------
 def writeFile(f, lines) :
@@ -12,22 +13,39 @@ def writeFile(f, lines) :
     for line in lines :
         f.write(str.encode(line.content + '\n'))
 
+toolPaths = {}
+
 #-------------------------------------------------------------------------------
-def run(platform, run_cmd) :
-    # run a generic command through xcrun an capture stdout
+def getSdk(platform) :
     if platform == 'ios':
-        sdk = 'iphoneos'
+        return 'iphoneos'
     else:
-        sdk = 'macosx'
+        return 'macosx'
+
+#-------------------------------------------------------------------------------
+def getToolPath(platform) :
+    '''
+    Return the path of the metal compiler binary, or an empty string
+    if it can't be found.
+    '''
+    if platform not in toolPaths :
+        try :
+            path = subprocess.check_output(['xcrun', '--sdk', getSdk(platform), '--find', 'metal'])
+            toolPaths[platform] = bytes.decode(path).strip()
+        except (OSError, subprocess.CalledProcessError) :
+            toolPaths[platform] = ''
+    return toolPaths[platform]
+
+#-------------------------------------------------------------------------------
+def run(platform, run_cmd) :
+    # run a generic command through xcrun an capture stdout
+    sdk = getSdk(platform)
     cmd = ['xcrun', '--sdk', sdk, '--run']
     cmd.extend(run_cmd)
-    child = subprocess.Popen(cmd, stderr=subprocess.PIPE)
-    out = ''
-    while True :
-        out += bytes.decode(child.stderr.read())
-        if child.poll() != None :
-            break
-    return out
+    inv = process.run(cmd)
+    if inv.stdout :
+        sys.stdout.write(inv.stdout)
+    return inv.stderr
 
 #-------------------------------------------------------------------------------
 def cc(platform, in_src, out_dia, out_air) :
@@ -98,25 +116,11 @@ def parseOutput(output, lines) :
         sys.exit(10) 
 
 #-------------------------------------------------------------------------------
-def writeBinHeader(in_bin, out_hdr, c_name) :
+def compile(lines, base_path, args) :
     '''
-    Write the metallib binary data into a C header file.
+    Compile the .metal source into a .metallib, which is
+    embedded into the generated source.
     '''
-    with open(in_bin, 'rb') as in_file :
-        data = in_file.read()
-    hexdata = binascii.hexlify(data)
-    with open(out_hdr, 'w') as out_file :
-        out_file.write('#pragma once\n')
-        out_file.write('static const unsigned char {}[] = {{\n'.format(c_name))
-        for i in range(0, len(data)) :
-            out_file.write('0x{}{},'.format(hexdata[i*2], hexdata[i*2+1]))
-            if (i % 16) == 15 :
-                out_file.write('\n')
-        out_file.write('\n};\n')
-
-#-------------------------------------------------------------------------------
-def compile(lines, base_path, c_name, args) :
-   
     platform = util.getEnv('target_platform')
     if platform != 'ios' and platform != 'osx' :
         return
@@ -127,11 +131,10 @@ def compile(lines, base_path, c_name, args) :
     metal_air_path = base_path + '.air'
     metal_lib_path = base_path + '.metal-ar'
     metal_bin_path = base_path + '.metallib'
-    c_header_path  = base_path + '.metallib.h'
 
     # compile .metal source file
     output = cc(platform, metal_src_path, metal_dia_path, metal_air_path)
-    parseOutput(output, lines)
+    with jobs.outputLock :
+        parseOutput(output, lines)
     output += ar(platform, metal_air_path, metal_lib_path)
     output += link(platform, metal_lib_path, metal_bin_path)
-    writeBinHeader(metal_bin_path, c_header_path, c_name)
@@ -0,0 +1,70 @@
+'''
+Whitespace minification of generated GLSL sources.
+
+GL drivers parse the embedded shader sources at runtime, so removing
+indentation, comments, blank lines and redundant whitespace makes both
+the executable smaller and shader creation a bit faster. The result is
+token-for-token identical to the input, and keeps the line structure
+(minus blank lines):
+
+    - comments and blank lines are removed
+    - in preprocessor directives whitespace is only collapsed (the space
+      in '#define A (x)' matters)
+    - in all other lines whitespace between two tokens is only kept if
+      removing it would merge the tokens (e.g. between two identifiers,
+      or in 'a - -b')
+'''
+import re
+
+commentRegex = re.compile(r'/\*.*?\*/|//[^\n]*', re.DOTALL)
+spaceRegex = re.compile(r'[ \t\f\v\r]+')
+
+# characters which can't be part of a multi-character token
+PUNCTUATION = set('{}()[];,')
+
+#-------------------------------------------------------------------------------
+def isWordChar(c) :
+    return c.isalnum() or c in '_.'
+
+#-------------------------------------------------------------------------------
+def needsSpace(left, right) :
+    '''
+    Return True if the whitespace between two characters must be kept.
+    '''
+    if isWordChar(left) and isWordChar(right) :
+        return True
+    if isWordChar(left) or isWordChar(right) :
+        return False
+    return left not in PUNCTUATION and right not in PUNCTUATION
+
+#-------------------------------------------------------------------------------
+def minifyLine(line) :
+    chunks = spaceRegex.split(line.strip())
+    result = chunks[0]
+    for chunk in chunks[1:] :
+        if needsSpace(result[-1], chunk[0]) :
+            result += ' '
+        result += chunk
+    return result
+
+#-------------------------------------------------------------------------------
+def minify(source) :
+    '''
+    Return the minified version of a GLSL source string.
+    '''
+    # comments are replaced with a space so that they still separate tokens
+    source = commentRegex.sub(lambda m: '\n' * m.group(0).count('\n') or ' ', source)
+    lines = []
+    inDirective = False
+    for line in source.split('\n') :
+        stripped = line.strip()
+        if not stripped :
+            inDirective = False
+            continue
+        if inDirective or stripped.startswith('#') :
+            lines.append(spaceRegex.sub(' ', stripped))
+            # a directive continues on the next line after a backslash
+            inDirective = stripped.endswith('\\')
+        else :
+            lines.append(minifyLine(line))
+    return '\n'.join(lines) + '\n' if lines else ''
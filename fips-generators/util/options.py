@@ -0,0 +1,12 @@
+'''
+Helpers for the generator args (the options passed from the
+fips-include.cmake wrapper or the command line).
+'''
+
+#-------------------------------------------------------------------------------
+def isTrue(args, key) :
+    '''
+    Return True if a boolean generator arg is set ("minify: 'true'",
+    also accepts on, yes and 1).
+    '''
+    return str(args.get(key, '')).lower() in ['true', 'on', 'yes', '1']
@@ -0,0 +1,83 @@
+'''
+Write-if-changed output files.
+
+Generated files are rendered into memory and only written when their
+content differs from what is on disk, so that regenerating a shader
+file with the same result doesn't touch the modification time of the
+outputs (and doesn't make the build system recompile everything which
+includes them). Files are replaced atomically, a build which is
+interrupted never leaves a half-written output behind.
+'''
+import os, io, stat, tempfile
+
+#-------------------------------------------------------------------------------
+def getUmask() :
+    # there's no way to read the umask without setting it
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+# read once, os.umask() isn't safe to call while other threads create files
+UMASK = getUmask()
+
+#-------------------------------------------------------------------------------
+def getFileMode(path) :
+    '''
+    Return the permission bits for a file written to path: those of
+    the existing file, or what open() would create (0666 minus umask).
+    mkstemp() creates files with 0600.
+    '''
+    try :
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError :
+        return 0o666 & ~UMASK
+
+#-------------------------------------------------------------------------------
+def writeIfChanged(path, data) :
+    '''
+    Write data (bytes or str) to path if the file doesn't exist or has
+    a different content, returns True if the file was written.
+    '''
+    if not isinstance(data, bytes) :
+        data = data.encode('utf-8')
+    try :
+        if os.path.getsize(path) == len(data) :
+            with open(path, 'rb') as f :
+                if f.read() == data :
+                    return False
+    except OSError :
+        pass
+    dir, name = os.path.split(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=dir)
+    try :
+        with os.fdopen(fd, 'wb') as f :
+            f.write(data)
+        os.chmod(tmp, getFileMode(path))
+        os.replace(tmp, path)
+    except BaseException :
+        os.remove(tmp)
+        raise
+    return True
+
+#-------------------------------------------------------------------------------
+class OutputFile(io.StringIO) :
+    '''
+    A text file which is written with writeIfChanged() when it is closed,
+    use like the file object returned by open(path, 'w').
+    '''
+    def __init__(self, path) :
+        io.StringIO.__init__(self)
+        self.path = path
+        self.changed = False
+
+    def close(self) :
+        if not self.closed :
+            self.changed = writeIfChanged(self.path, self.getvalue())
+        io.StringIO.close(self)
+
+    def __exit__(self, excType, excValue, traceback) :
+        # don't write partial output if generation failed
+        if excType is None :
+            self.close()
+        else :
+            io.StringIO.close(self)
@@ -0,0 +1,108 @@
+'''
+Minimal perfect hash over a list of names, built at generation time so
+that the generated C code can look up a name in constant time, with one
+pass over the name and one string compare.
+
+Each name is hashed once with crc32 (zlib.crc32, the generated C code
+has a matching implementation), the crc is then combined with a seed
+and scrambled with the murmur3 finalizer (crc32 alone is affine in its
+seed, so for names of equal length a different seed can't resolve a
+collision). The names are first distributed into n buckets, then for
+each bucket (largest first) a seed is searched which places all names
+of the bucket into free slots of the n-slot table (hash and displace):
+
+    h = crc32(name)
+    slot = mix(h ^ seeds[mix(h) % n]) % n
+    index = indices[slot]
+'''
+import zlib
+import genutil as util
+
+MAX_SEED = 1 << 24
+
+# C implementation of zlib's crc32() and the murmur3 finalizer,
+# the same as crc32() and mix() below
+HASH_SOURCE = '''static unsigned int shd__crc32(const char *str) {
+    unsigned int crc = 0xFFFFFFFFu;
+    int k;
+    while (*str) {
+        crc ^= (unsigned char) *str++;
+        for (k = 0; k < 8; k++) {
+            crc = (crc >> 1) ^ (0xEDB88320u & (0u - (crc & 1u)));
+        }
+    }
+    return ~crc;
+}
+
+static unsigned int shd__mix(unsigned int h) {
+    h ^= h >> 16;
+    h *= 0x85EBCA6Bu;
+    h ^= h >> 13;
+    h *= 0xC2B2AE35u;
+    h ^= h >> 16;
+    return h;
+}
+'''
+
+#-------------------------------------------------------------------------------
+def crc32(name) :
+    return zlib.crc32(name.encode('utf-8')) & 0xFFFFFFFF
+
+#-------------------------------------------------------------------------------
+def mix(h) :
+    h ^= h >> 16
+    h = (h * 0x85EBCA6B) & 0xFFFFFFFF
+    h ^= h >> 13
+    h = (h * 0xC2B2AE35) & 0xFFFFFFFF
+    h ^= h >> 16
+    return h
+
+#-------------------------------------------------------------------------------
+def build(names) :
+    '''
+    Return (seeds, indices), the per-bucket seeds and the index into
+    names for each slot, both lists have len(names) items.
+    '''
+    n = len(names)
+    hashes = [crc32(name) for name in names]
+    first = {}
+    for index, h in enumerate(hashes) :
+        if h in first :
+            util.fmtError("'{}' and '{}' have the same hash, please rename one of them".format(names[first[h]], names[index]))
+        first[h] = index
+    buckets = [[] for i in range(n)]
+    for index, h in enumerate(hashes) :
+        buckets[mix(h) % n].append(index)
+    seeds = [0] * n
+    indices = [None] * n
+    for bucket in sorted(range(n), key=lambda b: -len(buckets[b])) :
+        items = buckets[bucket]
+        if not items :
+            # empty buckets keep seed 0, a lookup which ends up
+            # here fails the string compare
+            break
+        seed = 1
+        while True :
+            slots = [mix(hashes[index] ^ seed) % n for index in items]
+            if len(set(slots)) == len(slots) and all(indices[slot] is None for slot in slots) :
+                break
+            seed += 1
+            if seed >= MAX_SEED :
+                util.fmtError("failed to build a perfect hash over the program names")
+        seeds[bucket] = seed
+        for index, slot in zip(items, slots) :
+            indices[slot] = index
+    return seeds, indices
+
+#-------------------------------------------------------------------------------
+def lookup(names, seeds, indices, name) :
+    '''
+    Python version of the generated lookup, returns the index
+    of name, or None if it isn't in names.
+    '''
+    n = len(names)
+    if n == 0 :
+        return None
+    h = crc32(name)
+    index = indices[mix(h ^ seeds[mix(h) % n]) % n]
+    return index if names[index] == name else None
@@ -0,0 +1,83 @@
+'''
+Pooled payloads and strings for generated C sources.
+
+Shader variants are often byte-identical (e.g. the glsl100 and glsles3
+output of SPIRV-Cross, or shaders which only differ in their name), and
+the reflection tables repeat the same uniform, input and block names
+for every shader and slang. The pools make sure that each unique
+payload and string is only emitted once, all references point to
+the pooled copy.
+'''
+import hashlib
+from util import embed
+
+MAX_LITERAL_SIZE = 65535    # MSVC's limit for (concatenated) string literals
+
+#-------------------------------------------------------------------------------
+def getPayloadKey(data, isBinary) :
+    '''
+    Return the key under which a payload is pooled.
+    '''
+    h = hashlib.sha1(b'bin:' if isBinary else b'txt:')
+    h.update(data)
+    return h.hexdigest()
+
+#-------------------------------------------------------------------------------
+class PayloadPool :
+    '''
+    Maps payload contents to the C name of their first definition.
+    '''
+    def __init__(self) :
+        self.names = {}         # content hash => C name
+        self.numBytes = 0       # total size of all added payloads
+        self.numUniqueBytes = 0 # size of the emitted payloads
+
+    def add(self, c_name, data, isBinary) :
+        '''
+        Add a payload, returns the C name under which it is defined,
+        and whether it is new (and must be defined as c_name).
+        '''
+        key = getPayloadKey(data, isBinary)
+        self.numBytes += len(data)
+        if key in self.names :
+            return self.names[key], False
+        self.names[key] = c_name
+        self.numUniqueBytes += len(data)
+        return c_name, True
+
+#-------------------------------------------------------------------------------
+class StringPool :
+    '''
+    Collects zero-terminated strings into a single char array, strings
+    are referenced as constant address expressions (so that they can
+    be used in static initializers).
+    '''
+    def __init__(self, c_name) :
+        self.c_name = c_name
+        self.offsets = {}
+        self.data = bytearray()
+
+    def ref(self, s) :
+        '''
+        Return the C expression for a pooled string (as char *).
+        '''
+        if s not in self.offsets :
+            self.offsets[s] = len(self.data)
+            self.data += s.encode('utf-8') + b'\0'
+        return '(char *) ({} + {})'.format(self.c_name, self.offsets[s])
+
+    def write(self, f) :
+        '''
+        Write the pool definition, must be called after all strings
+        have been referenced, and before the references are compiled.
+        '''
+        if not self.data :
+            return
+        data = bytes(self.data)
+        if len(data) < MAX_LITERAL_SIZE :
+            pieces = data.decode('latin-1').split('\0')[:-1]
+            f.write('static const char {}[] =\n'.format(self.c_name))
+            f.write('\n'.join('"{}\\0"'.format(piece.translate(embed.stringTable)) for piece in pieces))
+            f.write(';\n')
+        else :
+            f.write('static const char {}[{}] = {{\n{}\n}};\n'.format(self.c_name, len(data), embed.formatArray(data)))
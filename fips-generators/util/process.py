@@ -0,0 +1,135 @@
+'''
+Shared process runner used by all compiler wrappers.
+
+Both output pipes are drained by blocking reader threads (no polling,
+and no deadlock when the child fills the pipe which isn't being read),
+the number of concurrently running processes can be capped, and
+wall-clock and CPU time of each invocation is recorded.
+'''
+import subprocess, threading, time, os
+import genutil as util
+from util import trace
+
+maxProcesses = None     # None: no limit
+timeout = None          # in seconds, None: no timeout
+semaphore = None
+invocations = []
+invocationsLock = threading.Lock()
+
+#-------------------------------------------------------------------------------
+class Invocation :
+    def __init__(self, cmd) :
+        self.cmd = cmd
+        self.returncode = None
+        self.stdout = ''
+        self.stderr = ''
+        self.startTime = 0.0
+        self.wallTime = 0.0
+        self.cpuTime = None     # None if not available on this platform
+        self.timedOut = False
+
+#-------------------------------------------------------------------------------
+def getEnvNumber(name) :
+    try :
+        num = float(os.environ.get(name, ''))
+    except ValueError :
+        return None
+    return num if num > 0 else None
+
+#-------------------------------------------------------------------------------
+def configure(numProcesses=None, timeoutSeconds=None) :
+    '''
+    Set the global cap on concurrently running processes and the
+    per-process timeout, values which are None fall back to the
+    SHD_MAX_PROCESSES and SHD_TIMEOUT environment variables.
+    '''
+    global maxProcesses, timeout, semaphore
+    if numProcesses is None :
+        numProcesses = getEnvNumber('SHD_MAX_PROCESSES')
+    if timeoutSeconds is None :
+        timeoutSeconds = getEnvNumber('SHD_TIMEOUT')
+    maxProcesses = int(numProcesses) if numProcesses else None
+    timeout = timeoutSeconds
+    semaphore = threading.BoundedSemaphore(maxProcesses) if maxProcesses else None
+
+#-------------------------------------------------------------------------------
+def getInvocations() :
+    with invocationsLock :
+        return list(invocations)
+
+#-------------------------------------------------------------------------------
+def readPipe(pipe, chunks) :
+    chunks.append(pipe.read())
+    pipe.close()
+
+#-------------------------------------------------------------------------------
+def decodeStatus(status) :
+    if os.WIFSIGNALED(status) :
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+#-------------------------------------------------------------------------------
+def execute(inv) :
+    inv.startTime = time.time()
+    child = subprocess.Popen(inv.cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    timer = None
+    if timeout :
+        # the child must not be killed after it has been reaped
+        # (its pid might have been reused by then)
+        killLock = threading.Lock()
+        exited = threading.Event()
+        def kill() :
+            with killLock :
+                if not exited.is_set() :
+                    inv.timedOut = True
+                    child.kill()
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+    outChunks = []
+    errChunks = []
+    errReader = threading.Thread(target=readPipe, args=(child.stderr, errChunks))
+    errReader.start()
+    readPipe(child.stdout, outChunks)
+    errReader.join()
+    if hasattr(os, 'wait4') and hasattr(os, 'waitid') :
+        # wait without reaping, so that the timer can still safely kill
+        os.waitid(os.P_PID, child.pid, os.WEXITED | os.WNOWAIT)
+        if timer :
+            with killLock :
+                exited.set()
+            timer.cancel()
+        _, status, usage = os.wait4(child.pid, 0)
+        child.returncode = decodeStatus(status)
+        inv.cpuTime = usage.ru_utime + usage.ru_stime
+    else :
+        child.wait()
+        if timer :
+            timer.cancel()
+    inv.wallTime = time.time() - inv.startTime
+    inv.returncode = child.returncode
+    inv.stdout = bytes.decode(b''.join(outChunks), 'utf-8', 'replace')
+    inv.stderr = bytes.decode(b''.join(errChunks), 'utf-8', 'replace')
+
+#-------------------------------------------------------------------------------
+def run(cmd) :
+    '''
+    Run a command, wait for it to finish and return an Invocation
+    object with the exit code, captured stdout/stderr and timings.
+    A process which runs into the timeout is a fatal error.
+    '''
+    inv = Invocation(cmd)
+    if semaphore :
+        with semaphore :
+            execute(inv)
+    else :
+        execute(inv)
+    with invocationsLock :
+        invocations.append(inv)
+    if trace.enabled :
+        trace.addSpan(os.path.basename(cmd[0]), 'process', inv.startTime, inv.wallTime,
+            args={'cmd': ' '.join(cmd), 'status': inv.returncode, 'cpu': inv.cpuTime, 'timedOut': inv.timedOut})
+    if inv.timedOut :
+        util.fmtError("'{}' timed out after {} seconds".format(' '.join(cmd), timeout))
+    return inv
+
+configure()
@@ -0,0 +1,92 @@
+'''
+Consolidated reflection store of a shader library.
+
+The reflection data of all shaders of a shader file is kept in a single
+JSON file next to the generated header (<name>.refl.json), keyed by the
+shader's fingerprint (the hash over everything which affects the
+compiled shader) and slang:
+
+    {
+        "version": 1,
+        "shaders": {
+            "<fingerprint>": {
+                "name": "myVS",
+                "stage": "vs",
+                "reflection": { "<slang>": { "inputs": [...], "outputs": [...],
+                                             "textures": [...], "uniform_blocks": [...] } }
+            }
+        }
+    }
+
+The store is read once when a shader file is compiled, and written once
+after all its shaders have been compiled. A shader whose fingerprint is
+in the store doesn't need to be compiled (if its compiled payloads still
+exist), and tools can look up uniform and input layouts without
+parsing the per-shader reflection files.
+'''
+import json, threading
+from util import outfile
+
+VERSION = 1
+
+#-------------------------------------------------------------------------------
+def load(path) :
+    '''
+    Return the shader entries of a reflection store (see module doc),
+    or an empty dict if the file doesn't exist or has another version.
+    '''
+    try :
+        with open(path, 'r') as f :
+            data = json.load(f)
+    except (IOError, OSError, ValueError) :
+        return {}
+    if not isinstance(data, dict) or data.get('version') != VERSION :
+        return {}
+    return data.get('shaders', {})
+
+#-------------------------------------------------------------------------------
+class ReflectionDB :
+    def __init__(self, path) :
+        self.path = path
+        self.entries = load(path)
+        self.used = {}          # entries of the current build
+        self.lock = threading.Lock()
+
+    def get(self, key, slangs) :
+        '''
+        Return the reflection data by slang of a shader fingerprint,
+        or None if it isn't in the store for all slangs.
+        '''
+        entry = self.entries.get(key)
+        if entry is None :
+            return None
+        reflection = entry['reflection']
+        for slang in slangs :
+            if slang not in reflection :
+                return None
+        with self.lock :
+            self.used[key] = entry
+        return dict((slang, reflection[slang]) for slang in slangs)
+
+    def put(self, key, shd, reflection) :
+        '''
+        Store the reflection data by slang of a compiled shader.
+        '''
+        with self.lock :
+            self.used[key] = {
+                'name': shd.name,
+                'stage': shd.getTag(),
+                'reflection': reflection,
+            }
+
+    def save(self) :
+        '''
+        Write the entries of the current build, entries of shaders
+        which weren't part of it are dropped.
+        '''
+        with self.lock :
+            data = {'version': VERSION, 'shaders': self.used}
+            self.entries = self.used
+            # the next build (in watch mode) starts with an empty set
+            self.used = {}
+        outfile.writeIfChanged(self.path, json.dumps(data, indent=1, sort_keys=True) + '\n')
@@ -1,8 +1,9 @@
 '''
 wrapper-script for the oryol-shdc tool (wrapper around SPIRV-Cross)
 '''
-import subprocess, platform, os, sys
+import platform, os, sys
 import genutil as util
+from util import jobs, process
 
 #-------------------------------------------------------------------------------
 def getToolPath() :
@@ -21,28 +22,30 @@ def getToolPath() :
     return path + 'oryol-shdc'
 
 #-------------------------------------------------------------------------------
-def run(cmd):
-    child = subprocess.Popen(cmd, stderr=subprocess.PIPE)
-    out = ''
-    while True :
-        out += bytes.decode(child.stderr.read())
-        if child.poll() != None :
-            break
-    for line in out.splitlines():
-        util.fmtError(line, False)
-    if child.returncode != 0:
-        exit(child.returncode)
+def run(input, cmd):
+    inv = process.run(cmd)
+    with jobs.outputLock :
+        if inv.stdout :
+            sys.stdout.write(inv.stdout)
+        util.setErrorLocation(input, 0)
+        for line in inv.stderr.splitlines():
+            util.fmtError(line, False)
+    if inv.returncode != 0:
+        exit(inv.returncode)
+
+#-------------------------------------------------------------------------------
+def compileSlang(input, base_path, slang):
+    if 'glsl' in slang:
+        src_slang = 'glsl'
+    else:
+        src_slang = slang
+    src_path = '{}.{}.spv'.format(base_path, src_slang)
+    dst_path = '{}.{}'.format(base_path, slang)
+    tool = getToolPath()
+    cmd = [tool, '-spirv', src_path, '-o', dst_path, '-lang', slang]
+    run(input, cmd)
 
 #-------------------------------------------------------------------------------
 def compile(input, base_path, slangs):
-    util.setErrorLocation(input, 0)
     for slang in slangs:
-        if 'glsl' in slang:
-            src_slang = 'glsl'
-        else:
-            src_slang = slang
-        src_path = '{}.{}.spv'.format(base_path, src_slang)
-        dst_path = '{}.{}'.format(base_path, slang)
-        tool = getToolPath()
-        cmd = [tool, '-spirv', src_path, '-o', dst_path, '-lang', slang]
-        run(cmd)
\ No newline at end of file
+        compileSlang(input, base_path, slang)
\ No newline at end of file
@@ -0,0 +1,108 @@
+'''
+Size report of the generated output.
+
+For each program, stage and slang the report lists the bytes of the
+embedded shader source or binary, of the reflection tables and of the
+uniform structs, with totals per program, per slang and for the whole
+shader file:
+
+    {
+        "total": 12345,
+        "payloads": 10000,          # all payloads
+        "uniquePayloads": 8000,     # after identical payloads are pooled
+        "programs": { "<program>": { "total": ..., "source": ..., ... } },
+        "slangs": { "<slang>": { "total": ..., ... } },
+        "entries": [ { "program": ..., "stage": "vs", "shader": ...,
+                       "slang": ..., "source": ..., "binary": ...,
+                       "reflection": ..., "uniformStructs": ... } ]
+    }
+
+A shader which is used by several programs is counted for each of them.
+Reflection sizes are computed for the LP64 layout of the structs in the
+generated header, names are counted in full (before string pooling),
+"uniquePayloads" shows how much pooling saves.
+A report (or a file in the same format which only has "total" and
+"programs" totals) can be used as budget for check().
+'''
+import json
+from util import outfile
+
+# sizeof() of the reflection structs in the generated header (LP64)
+STRUCT_SIZES = {
+    'shd_input': 16,
+    'shd_texture': 16,
+    'shd_uniform': 24,
+    'shd_uniform_block': 40,
+    'shd_shader': 96,
+}
+
+KINDS = ['source', 'binary', 'reflection', 'uniformStructs']
+
+#-------------------------------------------------------------------------------
+def getReflectionSize(refl, shaderName) :
+    '''
+    Return the bytes of the reflection tables of a shader in one slang.
+    '''
+    size = STRUCT_SIZES['shd_shader'] + len(shaderName) + 1
+    for input in refl['inputs'] :
+        size += STRUCT_SIZES['shd_input'] + len(input['name']) + 1
+    for texture in refl['textures'] :
+        size += STRUCT_SIZES['shd_texture'] + len(texture['name']) + 1
+    for ub in refl['uniform_blocks'] :
+        size += STRUCT_SIZES['shd_uniform_block'] + len(ub['type']) + 1
+        for m in ub['members'] :
+            size += STRUCT_SIZES['shd_uniform'] + len(m['name']) + 1
+    return size
+
+#-------------------------------------------------------------------------------
+def addTotals(totals, entry) :
+    for kind in KINDS :
+        totals[kind] = totals.get(kind, 0) + entry[kind]
+        totals['total'] = totals.get('total', 0) + entry[kind]
+
+#-------------------------------------------------------------------------------
+def build(entries, numPayloadBytes, numUniquePayloadBytes) :
+    '''
+    Build the report from a list of entry dicts (see module doc).
+    '''
+    programs = {}
+    slangs = {}
+    total = {}
+    for entry in entries :
+        addTotals(programs.setdefault(entry['program'], {}), entry)
+        addTotals(slangs.setdefault(entry['slang'], {}), entry)
+        addTotals(total, entry)
+    return {
+        'total': total.get('total', 0),
+        'payloads': numPayloadBytes,
+        'uniquePayloads': numUniquePayloadBytes,
+        'programs': programs,
+        'slangs': slangs,
+        'entries': entries,
+    }
+
+#-------------------------------------------------------------------------------
+def write(path, report) :
+    outfile.writeIfChanged(path, json.dumps(report, indent=1, sort_keys=True) + '\n')
+
+#-------------------------------------------------------------------------------
+def getTotal(value) :
+    # budgets can be plain numbers, or totals dicts like in the report
+    if isinstance(value, dict) :
+        return value.get('total')
+    return value
+
+#-------------------------------------------------------------------------------
+def check(report, budget, tolerance=0.0) :
+    '''
+    Compare a report with a budget, returns a list of (name, size,
+    budget) for the total and each program which exceeds its budget
+    by more than tolerance percent. Programs without a budget are
+    only checked as part of the total.
+    '''
+    limits = [('total', report['total'], getTotal(budget.get('total')))]
+    budgetPrograms = budget.get('programs', {})
+    for name in sorted(report['programs']) :
+        limits.append((name, report['programs'][name]['total'], getTotal(budgetPrograms.get(name))))
+    return [(name, size, limit) for name, size, limit in limits
+        if limit is not None and size > limit * (1.0 + tolerance / 100.0)]
@@ -0,0 +1,151 @@
+'''
+std140 layout analysis of uniform blocks.
+
+Uniform blocks are uploaded as a whole for each draw call, so the
+padding which std140 alignment leaves between members is uploaded too.
+This computes the std140 layout of a block from its member types,
+reports how many bytes are padding, and proposes a member order which
+needs the least padding:
+
+    1. members which are a multiple of 16 bytes (vec4, matrices, arrays)
+    2. each vec3 followed by a float (which fills the 4-byte gap)
+    3. vec2 pairs, a left-over vec2 with up to two floats
+    4. the remaining floats
+
+Padding inside a member (matrix columns and array elements are padded
+to 16 bytes) can't be removed by reordering, only the padding between
+members and at the end of the block.
+'''
+import genutil as util
+from mod import log
+
+MODES = ['report', 'propose']
+
+# std140 size and base alignment of the single (non-array) types
+TYPES = {
+    'float': (4, 4),
+    'vec2':  (8, 8),
+    'vec3':  (12, 16),
+    'vec4':  (16, 16),
+    'mat2':  (32, 16),
+    'mat3':  (48, 16),
+    'mat4':  (64, 16),
+}
+
+# bytes which hold data (without the padding in matrix columns)
+DATA_SIZE = {
+    'float': 4,
+    'vec2':  8,
+    'vec3':  12,
+    'vec4':  16,
+    'mat2':  16,
+    'mat3':  36,
+    'mat4':  64,
+}
+
+#-------------------------------------------------------------------------------
+def getMode(args) :
+    '''
+    Return the layout analysis mode from the generator args
+    ("uniform_layout: 'propose'"), or None if disabled.
+    '''
+    mode = args.get('uniform_layout') or None
+    if mode is not None and mode not in MODES :
+        util.fmtError("invalid uniform layout mode '{}' (must be one of {})".format(mode, ', '.join(MODES)))
+    return mode
+
+#-------------------------------------------------------------------------------
+def roundup(val, round_to) :
+    return (val + (round_to - 1)) & ~(round_to - 1)
+
+#-------------------------------------------------------------------------------
+def getMemberLayout(member) :
+    '''
+    Return std140 (size, alignment) of a uniform block member
+    (a reflection dict with 'type' and 'num').
+    '''
+    size, align = TYPES[member['type']]
+    if member['num'] > 1 :
+        # array elements are padded to 16 bytes
+        stride = roundup(size, 16)
+        return stride * member['num'], 16
+    return size, align
+
+#-------------------------------------------------------------------------------
+def getBlockSize(members) :
+    '''
+    Return the std140 size of a uniform block with the members in this
+    order (rounded up to 16 bytes, like the block's base alignment).
+    '''
+    offset = 0
+    for member in members :
+        size, align = getMemberLayout(member)
+        offset = roundup(offset, align) + size
+    return roundup(offset, 16)
+
+#-------------------------------------------------------------------------------
+def getDataSize(members) :
+    return sum(DATA_SIZE[m['type']] * m['num'] for m in members)
+
+#-------------------------------------------------------------------------------
+def proposeOrder(members) :
+    '''
+    Return the members in an order which needs the least padding,
+    members of the same kind keep their relative order.
+    '''
+    wide = []
+    vec3s = []
+    vec2s = []
+    floats = []
+    for m in members :
+        size, align = getMemberLayout(m)
+        if size % 16 == 0 :
+            wide.append(m)
+        elif m['type'] == 'vec3' :
+            vec3s.append(m)
+        elif m['type'] == 'vec2' :
+            vec2s.append(m)
+        else :
+            floats.append(m)
+    result = list(wide)
+    for m in vec3s :
+        result.append(m)
+        if floats :
+            result.append(floats.pop(0))
+    result.extend(vec2s)
+    result.extend(floats)
+    return result
+
+#-------------------------------------------------------------------------------
+def formatMembers(members) :
+    return ' '.join('{} {}{};'.format(m['type'], m['name'], '[{}]'.format(m['num']) if m['num'] > 1 else '')
+        for m in members)
+
+#-------------------------------------------------------------------------------
+def analyze(members) :
+    '''
+    Return (size, padding, proposed members, proposed size) of a block.
+    '''
+    size = getBlockSize(members)
+    proposed = proposeOrder(members)
+    return size, size - getDataSize(members), proposed, getBlockSize(proposed)
+
+#-------------------------------------------------------------------------------
+def report(blocks, mode) :
+    '''
+    Log the padding of uniform blocks, blocks is a list of (shader name,
+    uniform block reflection), each block is only reported once. In
+    'propose' mode, a member order with less padding is proposed.
+    '''
+    seen = set()
+    for shaderName, ub in blocks :
+        members = ub['members']
+        key = (ub['type'], tuple((m['name'], m['type'], m['num']) for m in members))
+        if key in seen :
+            continue
+        seen.add(key)
+        size, padding, proposed, proposedSize = analyze(members)
+        log.info("## uniform block '{}' ({}): {} bytes, {} bytes padding ({}%)".format(
+            ub['type'], shaderName, size, padding, (padding * 100) // size if size else 0))
+        if mode == 'propose' and proposedSize < size :
+            log.info('##   {} bytes when reordered: {}'.format(proposedSize, formatMembers(proposed)))
@@ -0,0 +1,138 @@
+'''
+Phase-level tracing of shader builds.
+
+When enabled (with the SHD_TRACE environment variable or the 'trace'
+generator arg), a span is recorded for each generator phase, each
+compile job and each tool process (with its command line and exit
+status). At the end of a build the spans are written as a Chrome
+trace-event file (open it in chrome://tracing or Perfetto), and a
+summary table is printed.
+
+When tracing is disabled, span() returns a shared no-op object and
+nothing is recorded.
+'''
+import os, time, json, threading
+from mod import log
+
+enabled = False
+path = None
+events = []
+eventsLock = threading.Lock()
+threadIds = {}
+startTime = time.time()
+
+#-------------------------------------------------------------------------------
+def configure(args, name=None) :
+    '''
+    Enable tracing if the 'trace' generator arg or the SHD_TRACE
+    environment variable is set to a file path. If the path is a
+    directory, the trace is written to <name>.trace.json in it.
+    '''
+    global enabled, path
+    tracePath = args.get('trace') or os.environ.get('SHD_TRACE')
+    if not tracePath :
+        return
+    if os.path.isdir(tracePath) and name :
+        tracePath = os.path.join(tracePath, name + '.trace.json')
+    enabled = True
+    path = tracePath
+
+#-------------------------------------------------------------------------------
+def getThreadId() :
+    # small thread ids are easier to read in the trace viewer
+    ident = threading.current_thread().ident
+    with eventsLock :
+        if ident not in threadIds :
+            threadIds[ident] = len(threadIds)
+        return threadIds[ident]
+
+#-------------------------------------------------------------------------------
+def addSpan(name, category, start, duration, group=None, args=None) :
+    '''
+    Record a span which has already finished, start is a time.time()
+    value, duration in seconds. Spans are summarized by category and
+    group (default: name).
+    '''
+    event = {
+        'name': name,
+        'cat': category,
+        'ph': 'X',
+        'ts': int((start - startTime) * 1000000),
+        'dur': int(duration * 1000000),
+        'pid': os.getpid(),
+        'tid': getThreadId(),
+        'args': args or {},
+    }
+    with eventsLock :
+        events.append((event, group or name))
+
+#-------------------------------------------------------------------------------
+class Span :
+    def __init__(self, name, category, group, args) :
+        self.name = name
+        self.category = category
+        self.group = group
+        self.args = args
+
+    def __enter__(self) :
+        self.start = time.time()
+        return self
+
+    def __exit__(self, excType, excValue, traceback) :
+        if excType is not None :
+            self.args['error'] = excType.__name__
+        addSpan(self.name, self.category, self.start, time.time() - self.start, self.group, self.args)
+
+class NullSpan :
+    def __enter__(self) :
+        return self
+
+    def __exit__(self, excType, excValue, traceback) :
+        pass
+
+NULL_SPAN = NullSpan()
+
+#-------------------------------------------------------------------------------
+def span(name, category='phase', group=None, **args) :
+    '''
+    Return a context manager which records a span around its block.
+    '''
+    if not enabled :
+        return NULL_SPAN
+    return Span(name, category, group, args)
+
+#-------------------------------------------------------------------------------
+def getSummary() :
+    '''
+    Return a list of (category, group, count, total, max) tuples
+    (times in seconds), sorted by total time.
+    '''
+    groups = {}
+    with eventsLock :
+        for event, group in events :
+            key = (event['cat'], group)
+            count, total, longest = groups.get(key, (0, 0, 0))
+            groups[key] = (count + 1, total + event['dur'], max(longest, event['dur']))
+    summary = [(cat, group, count, total / 1000000.0, longest / 1000000.0)
+        for (cat, group), (count, total, longest) in groups.items()]
+    summary.sort(key=lambda s: -s[3])
+    return summary
+
+#-------------------------------------------------------------------------------
+def write() :
+    '''
+    Write all spans recorded so far to the trace file, and print
+    the summary table.
+    '''
+    if not enabled :
+        return
+    with eventsLock :
+        traceEvents = [event for event, group in events]
+    with open(path, 'w') as f :
+        json.dump({'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}, f)
+    summary = getSummary()
+    width = max([len(s[1]) for s in summary] + [5])
+    log.info('## trace written to {}'.format(path))
+    log.info('## {:<8} {:<{}} {:>6} {:>9} {:>9}'.format('kind', 'phase', width, 'count', 'total', 'max'))
+    for cat, group, count, total, longest in summary :
+        log.info('## {:<8} {:<{}} {:>6} {:>8.3f}s {:>8.3f}s'.format(cat, group, width, count, total, longest))
@@ -0,0 +1,123 @@
+'''
+File change notification for the watch mode.
+
+On Linux the directories of the watched files are watched with inotify
+(through ctypes, no extra dependencies), which reports a saved file
+immediately. Editors often save by writing a new file and renaming it
+over the old one, so directories are watched instead of the files
+themselves. On other platforms, or if inotify isn't available, the
+files are polled for modification time and size changes.
+'''
+import os, sys, time, struct, select
+
+POLL_INTERVAL = 0.2     # seconds
+SETTLE_TIME = 0.02      # collect the events of one save
+
+# inotify flags from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct('iIII')
+
+#-------------------------------------------------------------------------------
+def normPath(path) :
+    return os.path.normpath(os.path.abspath(path))
+
+#-------------------------------------------------------------------------------
+class PollingWatcher :
+    def __init__(self) :
+        self.stats = {}
+
+    def getStat(self, path) :
+        try :
+            st = os.stat(path)
+        except OSError :
+            return None
+        return (st.st_mtime, st.st_size)
+
+    def setPaths(self, paths) :
+        '''
+        Set the files to watch (replaces the previous set).
+        '''
+        paths = set(normPath(path) for path in paths)
+        self.stats = dict((path, self.stats.get(path) or self.getStat(path)) for path in paths)
+
+    def wait(self, timeout=None) :
+        '''
+        Wait until watched files changed, returns the set of changed
+        paths (empty if the timeout expired).
+        '''
+        start = time.time()
+        while True :
+            changed = set()
+            for path, stat in self.stats.items() :
+                newStat = self.getStat(path)
+                if newStat != stat :
+                    self.stats[path] = newStat
+                    changed.add(path)
+            if changed :
+                return changed
+            if timeout is not None and time.time() - start >= timeout :
+                return changed
+            time.sleep(POLL_INTERVAL)
+
+#-------------------------------------------------------------------------------
+class InotifyWatcher :
+    def __init__(self) :
+        import ctypes, ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0 :
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.dirs = {}      # watch descriptor => directory
+        self.paths = set()
+
+    def setPaths(self, paths) :
+        self.paths = set(normPath(path) for path in paths)
+        watched = set(self.dirs.values())
+        for dir in set(os.path.dirname(path) for path in self.paths) - watched :
+            wd = self.libc.inotify_add_watch(self.fd, dir.encode(sys.getfilesystemencoding()),
+                IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ATTRIB)
+            if wd >= 0 :
+                self.dirs[wd] = dir
+
+    def readEvents(self, changed) :
+        data = os.read(self.fd, 65536)
+        pos = 0
+        while pos + EVENT_HEADER.size <= len(data) :
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            name = data[pos:pos+length].rstrip(b'\0').decode(sys.getfilesystemencoding(), 'replace')
+            pos += length
+            if wd in self.dirs and name :
+                path = os.path.join(self.dirs[wd], name)
+                if path in self.paths :
+                    changed.add(path)
+
+    def wait(self, timeout=None) :
+        changed = set()
+        deadline = None if timeout is None else time.time() + timeout
+        while not changed :
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready :
+                return changed
+            self.readEvents(changed)
+        # a save can consist of several events (write, rename, attributes)
+        while select.select([self.fd], [], [], SETTLE_TIME)[0] :
+            self.readEvents(changed)
+        return changed
+
+#-------------------------------------------------------------------------------
+def create(poll=False) :
+    '''
+    Return an inotify watcher if available, or a polling watcher.
+    '''
+    if not poll and sys.platform.startswith('linux') :
+        try :
+            return InotifyWatcher()
+        except (OSError, AttributeError) :
+            pass
+    return PollingWatcher()
@@ -24,11 +24,21 @@ endif()
 #-------------------------------------------------------------------------------
 #   Wrap shader code generation
 #
+#   SHD_JOBS: number of parallel compile jobs (default: one per CPU core)
+#   SHD_CACHE: set to false to disable the compile cache
+#   SHD_EMBED: how shader binaries and sources are embedded (array, string or incbin)
+#   SHD_OUTPUT: source (default) or bundle to write a .shdb bundle file per shader file
+#   SHD_MINIFY: set to true to remove comments and redundant whitespace from GLSL sources
+#   SHD_COMPRESS: set to true to compress embedded payloads (decompressed on first use)
+#   SHD_UNIFORM_LAYOUT: report (std140 padding of uniform blocks) or propose (also propose member orders)
+#   SHD_TRACE: path of a Chrome trace file (or a directory for one trace per shader file)
+#
 macro(glsl_shader shd)
     if (DEBUG_SHADERS)
-        set(args "{type: 'glsl', debug: 'true', slang: '${SHD_SLANG}'}")
+        set(shd_debug "true")
     else()
-        set(args "{type: 'glsl', debug: 'false', slang: '${SHD_SLANG}'}")
+        set(shd_debug "false")
     endif()
+    set(args "{type: 'glsl', debug: '${shd_debug}', slang: '${SHD_SLANG}', jobs: '${SHD_JOBS}', cache: '${SHD_CACHE}', embed: '${SHD_EMBED}', output: '${SHD_OUTPUT}', minify: '${SHD_MINIFY}', compress: '${SHD_COMPRESS}', uniform_layout: '${SHD_UNIFORM_LAYOUT}', trace: '${SHD_TRACE}'}")
     fips_generate(FROM ${shd} TYPE Shader ARGS ${args})
 endmacro()
\ No newline at end of file